@@ -0,0 +1,7 @@
+###########################################################################################
+#                                                                                         #
+# Benchmarks of the evaluation pipeline (loading, matching, AP and plotting)              #
+#                                                                                         #
+# Usage: python -m benchmarks.run --help                                                  #
+#                                                                                         #
+###########################################################################################
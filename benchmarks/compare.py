@@ -0,0 +1,49 @@
+import argparse
+import json
+
+
+def compareReports(baseline, current):
+    """Pair the results of two reports written by benchmarks.run by number of images.
+    Returns a list of (images, stage, baseline seconds, current seconds) tuples."""
+    baselineResults = {r['images']: r['stages'] for r in baseline['results']}
+    rows = []
+    for result in current['results']:
+        stages = baselineResults.get(result['images'])
+        if stages is None:
+            continue
+        for stage, seconds in result['stages'].items():
+            if stage == 'mAP' or stage not in stages:
+                continue
+            rows.append((result['images'], stage, stages[stage], seconds))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.compare',
+        description='Compare the stage times of two JSON reports written by benchmarks.run.')
+    parser.add_argument('baseline', help='report of the reference commit')
+    parser.add_argument('current', help='report to compare with the reference')
+    args = parser.parse_args()
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    print('baseline: %s' % baseline.get('commit'))
+    print('current:  %s' % current.get('commit'))
+    print('%10s %8s %12s %12s %9s' % ('images', 'stage', 'baseline(s)', 'current(s)', 'speedup'))
+    for images, stage, before, after in compareReports(baseline, current):
+        speedup = '%8.2fx' % (before / after) if after > 0 else '%9s' % '-'
+        print('%10d %8s %12.4f %12.4f %s' % (images, stage, before, after, speedup))
+    # Different mAPs mean the two commits do not compute the same metrics
+    baselineMAP = {r['images']: r['stages'].get('mAP') for r in baseline['results']}
+    for result in current['results']:
+        before = baselineMAP.get(result['images'])
+        after = result['stages'].get('mAP')
+        if before is not None and after is not None and abs(before - after) > 1e-12:
+            print('WARNING: mAP of %d images changed from %.6f to %.6f' %
+                  (result['images'], before, after))
+
+
+if __name__ == '__main__':
+    main()
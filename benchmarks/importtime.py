@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Modules that the metrics-only path must not import
+HEAVY_MODULES = ['matplotlib', 'cv2', 'concurrent.futures']
+
+
+def _run(command, **kwargs):
+    start = time.perf_counter()
+    process = subprocess.run(command,
+                             stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE,
+                             check=True,
+                             **kwargs)
+    return time.perf_counter() - start, process.stderr.decode()
+
+
+def _metricsOnlyCommand(saveFolder, extra=()):
+    return [
+        sys.executable, *extra,
+        os.path.join(ROOT, 'pascalvoc.py'), '-mo', '-np', '-gt',
+        os.path.join(ROOT, 'groundtruths'), '-det',
+        os.path.join(ROOT, 'detections'), '-sp', saveFolder
+    ]
+
+
+def measureColdStart(repeat):
+    """Run pascalvoc.py -mo on the sample files repeat times, each in a new interpreter.
+    Returns a dictionary with the wall times of the runs ('seconds'), the wall times of an empty
+    interpreter ('interpreter seconds'), the self time in microseconds of the heaviest imports
+    ('imports') and the heavy modules imported ('heavy modules')."""
+    seconds = []
+    interpreter = []
+    with tempfile.TemporaryDirectory() as tempFolder:
+        for r in range(repeat):
+            interpreter.append(_run([sys.executable, '-c', 'pass'])[0])
+            # A new (empty) folder each run, so pascalvoc.py does not ask to overwrite it
+            saveFolder = os.path.join(tempFolder, str(r))
+            os.makedirs(saveFolder)
+            seconds.append(_run(_metricsOnlyCommand(saveFolder), cwd=tempFolder)[0])
+        saveFolder = os.path.join(tempFolder, 'importtime')
+        os.makedirs(saveFolder)
+        _, log = _run(_metricsOnlyCommand(saveFolder, ['-X', 'importtime']), cwd=tempFolder)
+    imports = {}
+    for line in log.splitlines():
+        # import time: <self us> | <cumulative us> | <module>
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)', line)
+        if match is not None:
+            imports[match.group(4)] = int(match.group(1))
+    heavy = sorted(m for m in imports
+                   if any(m == h or m.startswith(h + '.') for h in HEAVY_MODULES))
+    return {
+        'seconds': seconds,
+        'interpreter seconds': interpreter,
+        'imports': dict(sorted(imports.items(), key=lambda i: -i[1])[:15]),
+        'heavy modules': heavy
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.importtime',
+        description='Measure the cold start of pascalvoc.py in metrics-only mode (-mo) on the '
+        'sample files and check it against a time budget. Exits with status 1 if the budget is '
+        'exceeded or if matplotlib, cv2 or concurrent.futures are imported.')
+    parser.add_argument('--repeat', type=int, default=10, help='number of runs. Default 10')
+    parser.add_argument('--budget',
+                        type=float,
+                        default=0.5,
+                        help='maximum median wall time in seconds of a run, not counting the '
+                        'start-up of an empty interpreter. Default 0.5')
+    parser.add_argument('-o', '--output', help='JSON file where the measures are saved')
+    args = parser.parse_args()
+
+    report = measureColdStart(args.repeat)
+    median = statistics.median(report['seconds'])
+    interpreter = statistics.median(report['interpreter seconds'])
+    report['budget'] = args.budget
+    report['median seconds'] = median - interpreter
+    print('pascalvoc.py -mo: median %.3fs, min %.3fs (empty interpreter: %.3fs)' %
+          (median, min(report['seconds']), interpreter))
+    print('Heaviest imports (self time):')
+    for module, us in report['imports'].items():
+        print('  %-40s %8.1f ms' % (module, us / 1000))
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    failed = False
+    if report['heavy modules']:
+        print('FAIL: heavy modules imported: %s' % ', '.join(report['heavy modules']))
+        failed = True
+    if median - interpreter > args.budget:
+        print('FAIL: %.3fs over the budget of %.3fs' % (median - interpreter, args.budget))
+        failed = True
+    if not failed:
+        print('OK: %.3fs within the budget of %.3fs' % (median - interpreter, args.budget))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import _init_paths
+from BoundingBoxesLoader import loadBoundingBoxes
+from Evaluator import *
+
+from . import synthetic
+
+# File of each dataset folder with the parameters the dataset was generated from
+DATASET_FILE = 'dataset.json'
+
+ENGINES = {
+    'scalar': MatchingEngine.Scalar,
+    'vectorized': MatchingEngine.Vectorized,
+    'spatial': MatchingEngine.SpatialIndex
+}
+
+
+def _timeIt(function, repeat):
+    """Run function repeat times and return (shortest time, last result)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _gitCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def getDataset(folder, **parameters):
+    """Generate the synthetic dataset of folder (see synthetic.generateDataset), or reuse it if
+    it was already generated from the same parameters.
+    Returns the dictionary returned by synthetic.generateDataset, plus the 'generation' time in
+    seconds (None if the dataset was reused)."""
+    datasetPath = os.path.join(folder, DATASET_FILE)
+    try:
+        with open(datasetPath) as f:
+            dataset = json.load(f)
+        if dataset['parameters'] == parameters:
+            return dict(dataset['info'], generation=None)
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    # Written again below, once all files of the dataset are written
+    if os.path.exists(datasetPath):
+        os.remove(datasetPath)
+    start = time.perf_counter()
+    info = synthetic.generateDataset(folder, **parameters)
+    generation = time.perf_counter() - start
+    with open(datasetPath, 'w') as f:
+        json.dump({'parameters': parameters, 'info': info}, f, indent=2)
+    return dict(info, generation=generation)
+
+
+def benchmarkStages(folder, engine, method, iouThreshold, repeat, plot, workers=1):
+    """Time the stages of the evaluation of the dataset in folder.
+    Returns a dictionary mapping each stage ('load', 'match', 'ap' and 'plot') to its time in
+    seconds, plus the 'mAP' obtained."""
+    stages = {}
+
+    def load():
+        boxes, _ = loadBoundingBoxes(os.path.join(folder, 'groundtruths'),
+                                     True,
+                                     BBFormat.XYWH,
+                                     CoordinatesType.Absolute,
+                                     workers=workers)
+        boxes, _ = loadBoundingBoxes(os.path.join(folder, 'detections'),
+                                     False,
+                                     BBFormat.XYWH,
+                                     CoordinatesType.Absolute,
+                                     boxes,
+                                     workers=workers)
+        return boxes
+
+    stages['load'], boxes = _timeIt(load, repeat)
+
+    def match():
+        classes, index = Evaluator._indexBoundingBoxes(boxes)
+        matches = []
+        for c in classes:
+            images, bbs = Evaluator._sortDetections(index[c])
+            TP, FP, _, _ = Evaluator._matchClass(images, bbs, index[c]['groundTruths'],
+                                                 iouThreshold, engine)
+            matches.append((c, TP, FP, index[c]['total positives']))
+        return matches
+
+    stages['match'], matches = _timeIt(match, repeat)
+    stages['ap'], results = _timeIt(
+        lambda: [Evaluator._getClassMetrics(c, TP, FP, npos, method)
+                 for c, TP, FP, npos in matches], repeat)
+    if plot:
+        with tempfile.TemporaryDirectory() as plotFolder:
+            evaluator = Evaluator()
+            # Render the results already computed, so only the plotting is timed
+            evaluator.GetPascalVOCMetrics = lambda *args, **kwargs: results
+            stages['plot'], _ = _timeIt(
+                lambda: evaluator.PlotPrecisionRecallCurve(
+                    boxes, iouThreshold, method, showAP=True, savePath=plotFolder,
+                    showGraphic=False), repeat)
+    aps = [r['AP'] for r in results if r['total positives'] > 0]
+    stages['mAP'] = float(np.mean(aps)) if len(aps) > 0 else None
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run',
+        description='Time the loading, matching, AP and plotting stages of the evaluation on '
+        'synthetic datasets of increasing sizes and write the results as JSON.')
+    parser.add_argument('-s',
+                        '--sizes',
+                        type=int,
+                        nargs='+',
+                        default=[100, 1000, 10000],
+                        help='numbers of images of the datasets. Default 100 1000 10000')
+    parser.add_argument('--classes', type=int, default=20, help='number of classes. Default 20')
+    parser.add_argument('--boxesperimage',
+                        type=float,
+                        default=5,
+                        help='average number of ground truths per image. Default 5')
+    parser.add_argument('--detectionsperbox',
+                        type=float,
+                        default=1.5,
+                        help='average number of detections per ground truth. Default 1.5')
+    parser.add_argument('--fpperimage',
+                        type=float,
+                        default=2,
+                        help='average number of random detections per image. Default 2')
+    parser.add_argument('--confidence',
+                        choices=['uniform', 'correlated'],
+                        default='uniform',
+                        help='distribution of the confidences. Default uniform')
+    parser.add_argument('--overlap',
+                        choices=sorted(synthetic.OVERLAP_PROFILES),
+                        default='medium',
+                        help='overlap profile of the detections. Default medium')
+    parser.add_argument('--seed', type=int, default=0, help='random seed. Default 0')
+    parser.add_argument('--engine',
+                        choices=list(ENGINES),
+                        default='scalar',
+                        help='matching engine. Default scalar')
+    parser.add_argument('-t', '--threshold', type=float, default=0.5, help='IOU threshold')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='processes used to load')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per stage (min is kept)')
+    parser.add_argument('--noplot', action='store_true', help='skip the plot stage')
+    parser.add_argument('--datafolder',
+                        help='folder where the datasets are generated (and reused if they '
+                        'were generated with the same parameters). Default: a temporary folder')
+    parser.add_argument('-o', '--output', help='JSON file to write. Default: standard output')
+    args = parser.parse_args()
+
+    engine = ENGINES[args.engine]
+    parameters = {k: v for k, v in vars(args).items() if k not in ('output', 'datafolder')}
+    report = {
+        'commit': _gitCommit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'parameters': parameters,
+        'results': []
+    }
+    with tempfile.TemporaryDirectory() as tempFolder:
+        dataFolder = args.datafolder or tempFolder
+        for size in args.sizes:
+            folder = os.path.join(
+                dataFolder, 'synthetic_%d_%d_%s_%s_%d' %
+                (size, args.classes, args.confidence, args.overlap, args.seed))
+            info = getDataset(folder,
+                              images=size,
+                              classes=args.classes,
+                              boxesPerImage=args.boxesperimage,
+                              detectionsPerBox=args.detectionsperbox,
+                              falsePositivesPerImage=args.fpperimage,
+                              confidence=args.confidence,
+                              overlap=args.overlap,
+                              seed=args.seed)
+            info['stages'] = benchmarkStages(folder, engine,
+                                             MethodAveragePrecision.EveryPointInterpolation,
+                                             args.threshold, args.repeat, not args.noplot,
+                                             args.workers)
+            report['results'].append(info)
+            print('%d images: %s' % (size, ', '.join(
+                '%s %.3fs' % (k, v) for k, v in info['stages'].items() if k != 'mAP')),
+                  file=sys.stderr)
+    output = json.dumps(report, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
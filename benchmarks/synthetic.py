@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+
+# Standard deviation of the noise added to the ground truths to create the detections,
+# relative to the size of the boxes. The smaller the noise, the higher the IOUs.
+OVERLAP_PROFILES = {'tight': 0.05, 'medium': 0.15, 'loose': 0.35}
+
+
+def generateDataset(folder,
+                    images=1000,
+                    classes=20,
+                    boxesPerImage=5,
+                    detectionsPerBox=1.5,
+                    falsePositivesPerImage=2,
+                    confidence='uniform',
+                    overlap='medium',
+                    bbFormat='xywh',
+                    imgSize=(640, 480),
+                    seed=0):
+    """Write a reproducible synthetic set of ground truths and detections.
+    The files are written in <folder>/groundtruths and <folder>/detections, one txt file per
+    image, in the formats read by pascalvoc.py (absolute coordinates).
+    Args:
+        folder: output folder;
+        images: number of images;
+        classes: number of classes;
+        boxesPerImage: average number of ground truths per image (Poisson distributed);
+        detectionsPerBox: average number of detections created around each ground truth;
+        falsePositivesPerImage: average number of detections placed at random in each image;
+        confidence: distribution of the confidences: 'uniform' (independent of the overlap) or
+        'correlated' (detections closer to their ground truth have higher confidences);
+        overlap: noise profile of the detections around the ground truths ('tight', 'medium'
+        or 'loose', see OVERLAP_PROFILES);
+        bbFormat: 'xywh' (<left> <top> <width> <height>) or 'xyrb' (<left> <top> <right>
+        <bottom>);
+        imgSize: (width, height) of the images;
+        seed: seed of the random generator.
+    Returns:
+        A dictionary with the number of 'images', 'ground truths' and 'detections' written.
+    """
+    rng = np.random.default_rng(seed)
+    noise = OVERLAP_PROFILES[overlap]
+    gtFolder = os.path.join(folder, 'groundtruths')
+    detFolder = os.path.join(folder, 'detections')
+    os.makedirs(gtFolder, exist_ok=True)
+    os.makedirs(detFolder, exist_ok=True)
+    width, height = imgSize
+    totalGTs = 0
+    totalDets = 0
+    for i in range(images):
+        nGTs = rng.poisson(boxesPerImage)
+        gtClasses = rng.integers(0, classes, nGTs)
+        w = rng.uniform(0.05, 0.4, nGTs) * width
+        h = rng.uniform(0.05, 0.4, nGTs) * height
+        x = rng.uniform(0, 1, nGTs) * (width - w)
+        y = rng.uniform(0, 1, nGTs) * (height - h)
+        gts = np.stack((x, y, w, h), axis=1).round()
+        # Detections around the ground truths
+        owners = np.repeat(np.arange(nGTs), rng.poisson(detectionsPerBox, nGTs))
+        jitter = rng.normal(0, noise, (len(owners), 4))
+        dets = gts[owners] + jitter * np.repeat(gts[owners, 2:], 2, axis=1)
+        detClasses = gtClasses[owners]
+        if confidence == 'correlated':
+            detConfidences = np.exp(-np.abs(jitter).mean(axis=1) / noise)
+        else:
+            detConfidences = rng.uniform(0, 1, len(owners))
+        # Detections placed at random
+        nFPs = rng.poisson(falsePositivesPerImage)
+        fpW = rng.uniform(0.05, 0.4, nFPs) * width
+        fpH = rng.uniform(0.05, 0.4, nFPs) * height
+        fps = np.stack((rng.uniform(0, 1, nFPs) * (width - fpW),
+                        rng.uniform(0, 1, nFPs) * (height - fpH), fpW, fpH),
+                       axis=1)
+        dets = np.concatenate((dets, fps))
+        detClasses = np.concatenate((detClasses, rng.integers(0, classes, nFPs)))
+        detConfidences = np.concatenate((detConfidences, rng.uniform(0, 0.5, nFPs)))
+        dets[:, 2:] = np.maximum(dets[:, 2:], 1)
+        if bbFormat == 'xyrb':
+            gts[:, 2:] += gts[:, :2]
+            dets[:, 2:] += dets[:, :2]
+        name = 'img%07d.txt' % i
+        with open(os.path.join(gtFolder, name), 'w') as f:
+            f.write(''.join('class%d %d %d %d %d\n' % ((c, ) + tuple(b))
+                            for c, b in zip(gtClasses.tolist(), gts.tolist())))
+        with open(os.path.join(detFolder, name), 'w') as f:
+            f.write(''.join('class%d %.6f %.2f %.2f %.2f %.2f\n' % ((c, s) + tuple(b))
+                            for c, s, b in zip(detClasses.tolist(), detConfidences.tolist(),
+                                               dets.tolist())))
+        totalGTs += nGTs
+        totalDets += len(dets)
+    return {'images': images, 'ground truths': int(totalGTs), 'detections': int(totalDets)}
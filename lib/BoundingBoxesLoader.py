@@ -0,0 +1,457 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from itertools import repeat
+
+import numpy as np
+
+from ColumnarBoundingBoxes import *
+from utils import *
+
+
+def listFiles(directory):
+    """Return the sorted paths of the txt files of a folder (same as globbing *.txt)."""
+    # os.scandir avoids the per-file overhead of glob, noticeable with many small files
+    with os.scandir(directory) as entries:
+        names = [e.name for e in entries if e.name.endswith('.txt') and e.name[0] != '.']
+    names.sort()
+    return [os.path.join(directory, name) for name in names]
+
+
+# Bytes separating the values of a line, as for bytes.split()
+_WHITESPACE = np.zeros(256, dtype=bool)
+_WHITESPACE[list(b' \t\n\r\x0b\x0c')] = True
+
+
+def _getMalformedFiles(contents, nColumns):
+    """Positions of the files (given by their contents) with a non-empty line that does not
+    have exactly nColumns values, found with a single NumPy pass over all files."""
+    data = b'\n'.join(contents)
+    if len(data) == 0:
+        return set()
+    chars = np.frombuffer(data, dtype=np.uint8)
+    space = _WHITESPACE[chars]
+    # Each value starts with a non-whitespace byte after a whitespace byte (or the start)
+    starts = np.flatnonzero(~space & np.concatenate(([True], space[:-1])))
+    breaks = np.flatnonzero((chars == ord('\n')) | (chars == ord('\r')))
+    valuesPerLine = np.bincount(np.searchsorted(breaks, starts), minlength=len(breaks) + 1)
+    badLines = np.flatnonzero((valuesPerLine != 0) & (valuesPerLine != nColumns))
+    if len(badLines) == 0:
+        return set()
+    lineStarts = np.concatenate(([0], breaks + 1))[badLines]
+    fileStarts = np.cumsum([0] + [len(c) + 1 for c in contents[:-1]])
+    return set((np.searchsorted(fileStarts, lineStarts, side='right') - 1).tolist())
+
+
+def parseFiles(files, isGT, bbFormat, coordType, imgSize=None):
+    """Parse txt files containing bounding boxes (ground truths or detections) into columns.
+    Each non-empty line of a ground truth file is "<class_id> <x> <y> <w or x2> <h or y2>" and
+    each line of a detection file is "<class_id> <confidence> <x> <y> <w or x2> <h or y2>". The
+    name of the image is the name of the file without the .txt extension. Values are separated
+    by whitespace (spaces or tabs); values after the expected ones are ignored.
+    Args:
+        files: paths of the txt files;
+        isGT: True if the files contain ground truths, False if they contain detections;
+        bbFormat: BBFormat of the coordinates in the files;
+        coordType: CoordinatesType of the coordinates in the files;
+        imgSize (optional): (width, height) of the images. Required for relative coordinates.
+    Returns:
+        A dictionary with the keys:
+        'image names': name of the image of each file;
+        'class names': class ids, in order of appearance;
+        'image ids': position in 'image names' of the image of each bounding box;
+        'class ids': position in 'class names' of the class of each bounding box;
+        'coordinates': (N, 4) array with the absolute coordinates (XYX2Y2) of the boxes;
+        'confidences': confidence of each bounding box (NaN for ground truths).
+    """
+    if coordType == CoordinatesType.Relative:
+        if imgSize is None:
+            raise IOError(
+                'Parameter \'imgSize\' is required. It is necessary to inform the image size.')
+        if bbFormat != BBFormat.XYWH:
+            raise IOError('For relative coordinates, the format must be XYWH (x,y,width,height)')
+    nColumns = 5 if isGT else 6
+    imageNames = []
+    contents = []
+    for f in files:
+        imageNames.append(os.path.basename(f).replace('.txt', ''))
+        # Files are read as bytes: NumPy parses the numbers directly from the tokens
+        with open(f, 'rb') as fh:
+            contents.append(fh.read())
+    malformed = _getMalformedFiles(contents, nColumns)
+    boxesPerFile = []
+    tokens = []
+    for i, (f, data) in enumerate(zip(files, contents)):
+        if i not in malformed:
+            fileTokens = data.split()
+        else:
+            # Lines with extra (or missing) values: parse line by line
+            fileTokens = []
+            for line in data.splitlines():
+                splitLine = line.split()
+                if len(splitLine) == 0:
+                    continue
+                if len(splitLine) < nColumns:
+                    raise IOError('File %s: expected %d values per line, got \'%s\'' %
+                                  (f, nColumns, line.decode()))
+                fileTokens.extend(splitLine[:nColumns])
+        boxesPerFile.append(len(fileTokens) // nColumns)
+        tokens.extend(fileTokens)
+    # Classes are collected with np.unique and ordered by their first appearance
+    classNames, classIds = np.unique(np.array(tokens[0::nColumns], dtype=bytes),
+                                     return_inverse=True)
+    firstSeen = np.argsort(np.unique(classIds, return_index=True)[1], kind='stable')
+    remap = np.empty(len(firstSeen), dtype=np.int32)
+    remap[firstSeen] = np.arange(len(firstSeen), dtype=np.int32)
+    classIds = remap[classIds.reshape(-1)]
+    classNames = [c.decode() for c in classNames[firstSeen].tolist()]
+    values = [np.array(tokens[i::nColumns], dtype=np.float64) for i in range(1, nColumns)]
+    if isGT:
+        confidences = np.full(len(classIds), np.nan)
+        x, y, w, h = values
+    else:
+        confidences, x, y, w, h = values
+    coordinates = np.empty((len(classIds), 4))
+    if coordType == CoordinatesType.Relative:
+        # Same as convertToAbsoluteValues
+        coordinates[:, 0] = np.maximum(np.round((2 * x - w) * imgSize[0] / 2), 0)
+        coordinates[:, 1] = np.maximum(np.round((2 * y - h) * imgSize[1] / 2), 0)
+        xEnd = np.round((2 * x - w) * imgSize[0] / 2) + np.round(w * imgSize[0])
+        yEnd = np.round((2 * y - h) * imgSize[1] / 2) + np.round(h * imgSize[1])
+        coordinates[:, 2] = np.where(xEnd >= imgSize[0], imgSize[0] - 1, xEnd)
+        coordinates[:, 3] = np.where(yEnd >= imgSize[1], imgSize[1] - 1, yEnd)
+    elif bbFormat == BBFormat.XYWH:
+        coordinates[:, 0] = x
+        coordinates[:, 1] = y
+        coordinates[:, 2] = x + w
+        coordinates[:, 3] = y + h
+    else:  # bbFormat == BBFormat.XYX2Y2: <left> <top> <right> <bottom>.
+        coordinates[:, 0] = x
+        coordinates[:, 1] = y
+        coordinates[:, 2] = w
+        coordinates[:, 3] = h
+    return {
+        'image names': imageNames,
+        'class names': classNames,
+        'image ids': np.repeat(np.arange(len(files), dtype=np.int32), boxesPerFile),
+        'class ids': classIds,
+        'coordinates': coordinates,
+        'confidences': confidences
+    }
+
+
+def mergeColumns(parts):
+    """Merge the dictionaries returned by parseFiles for consecutive lists of files into the
+    dictionary that parseFiles would return for all files."""
+    if len(parts) == 1:
+        return parts[0]
+    classIndex = {}
+    classIds = []
+    imageIds = []
+    imageOffset = 0
+    for part in parts:
+        # Classes keep their order of first appearance across all parts
+        classTable = np.array([classIndex.setdefault(c, len(classIndex))
+                               for c in part['class names']], dtype=np.int32)
+        classIds.append(classTable[part['class ids']])
+        imageIds.append(part['image ids'] + imageOffset)
+        imageOffset += len(part['image names'])
+    return {
+        'image names': [name for part in parts for name in part['image names']],
+        'class names': list(classIndex),
+        'image ids': np.concatenate(imageIds).astype(np.int32, copy=False),
+        'class ids': np.concatenate(classIds).astype(np.int32, copy=False),
+        'coordinates': np.concatenate([part['coordinates'] for part in parts]),
+        'confidences': np.concatenate([part['confidences'] for part in parts])
+    }
+
+
+def parseFilesParallel(files, isGT, bbFormat, coordType, imgSize=None, workers=1):
+    """Same as parseFiles, but splits the files into chunks parsed by a pool of worker
+    processes. The chunks are merged in the order of the files, so the result does not depend
+    on the number of workers."""
+    if workers is None or workers <= 1 or len(files) < 2 * workers:
+        return parseFiles(files, isGT, bbFormat, coordType, imgSize)
+    # A few chunks per worker balance the load without much merging overhead
+    chunkSize = -(-len(files) // (4 * workers))
+    chunks = [files[i:i + chunkSize] for i in range(0, len(files), chunkSize)]
+    with getPoolExecutor(ExecutorType.Process)(max_workers=workers) as executor:
+        parts = list(
+            executor.map(parseFiles, chunks, repeat(isGT), repeat(bbFormat), repeat(coordType),
+                         repeat(imgSize)))
+    return mergeColumns(parts)
+
+
+# Columns with one value per bounding box
+ROW_COLUMNS = ['image ids', 'class ids', 'bb types', 'coordinates', 'confidences']
+
+
+def selectDetections(imageIds,
+                     classIds,
+                     confidences,
+                     minConfidence=None,
+                     maxDets=None,
+                     maxDetsPerClass=False):
+    """Select the detections kept by a minimum confidence and a maximum number of detections
+    per image (or per image and class), like the maxDets parameter of the COCO evaluation.
+    When an image has more than maxDets detections, those with the highest confidences are
+    kept; among equal confidences, the first ones in the file are kept, so the selection is
+    the same as taking the first maxDets detections after a stable sort by confidence. Only the
+    detections of the images over the limit are sorted.
+    Args:
+        imageIds, classIds, confidences: columns of the detections (see parseFiles);
+        minConfidence (optional): detections with lower confidences are discarded;
+        maxDets (optional): maximum number of detections kept per image;
+        maxDetsPerClass (optional): if True, maxDets applies to each class of each image
+        instead of to each image (default = False).
+    Returns:
+        The sorted positions of the detections kept.
+    """
+    confidences = np.asarray(confidences)
+    if minConfidence is not None:
+        keep = np.flatnonzero(confidences >= minConfidence)
+    else:
+        keep = np.arange(len(confidences))
+    if maxDets is None or len(keep) == 0:
+        return keep
+    groups = np.asarray(imageIds)[keep].astype(np.int64)
+    if maxDetsPerClass:
+        classIds = np.asarray(classIds)
+        groups = groups * (int(classIds.max()) + 1) + classIds[keep]
+    _, inverse, counts = np.unique(groups, return_inverse=True, return_counts=True)
+    over = counts[inverse.reshape(-1)] > maxDets
+    if not over.any():
+        return keep
+    rows = keep[over]
+    # By group, decreasing confidence and position in the file
+    order = np.lexsort((rows, -confidences[rows], groups[over]))
+    sortedGroups = groups[over][order]
+    starts = np.flatnonzero(np.concatenate(([True], sortedGroups[1:] != sortedGroups[:-1])))
+    sizes = np.diff(np.append(starts, len(order)))
+    rank = np.arange(len(order)) - np.repeat(starts, sizes)
+    return np.sort(np.concatenate((keep[~over], rows[order[rank < maxDets]])))
+
+
+def pruneDetections(columns, minConfidence=None, maxDets=None, maxDetsPerClass=False):
+    """Apply selectDetections to the columns returned by parseFiles (or by
+    ColumnarBoundingBoxes.getColumns). Returns the columns of the detections kept (the same
+    dictionary if none is discarded)."""
+    if minConfidence is None and maxDets is None:
+        return columns
+    rows = selectDetections(columns['image ids'], columns['class ids'], columns['confidences'],
+                            minConfidence, maxDets, maxDetsPerClass)
+    if len(rows) == len(columns['class ids']):
+        return columns
+    pruned = dict(columns)
+    for c in ROW_COLUMNS:
+        if c in pruned:
+            pruned[c] = pruned[c][rows]
+    return pruned
+
+
+def _groupRows(columns):
+    """For each image of the columns returned by parseFiles, a dictionary mapping the class ids
+    to the rows of their bounding boxes (in the order of the file)."""
+    groups = [{} for _ in columns['image names']]
+    imageIds = columns['image ids']
+    classIds = columns['class ids']
+    if len(classIds) == 0:
+        return groups
+    # Stable: the boxes of each image and class keep their order
+    order = np.lexsort((classIds, imageIds))
+    keys = imageIds[order].astype(np.int64) * len(columns['class names']) + classIds[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    for rows in np.split(order, starts[1:]):
+        groups[imageIds[rows[0]]][columns['class names'][classIds[rows[0]]]] = rows
+    return groups
+
+
+def iterImages(gtDirectory,
+               detDirectory,
+               gtFormat,
+               detFormat,
+               gtCoordType,
+               detCoordType,
+               imgSize=None,
+               batchSize=1000,
+               minConfidence=None,
+               maxDets=None,
+               maxDetsPerClass=False):
+    """Read the ground truths and the detections of two folders image by image, in the order of
+    the names of the files. An image may have only ground truths or only detections. Only
+    batchSize files of each folder are held in memory at a time.
+    Args:
+        gtDirectory: folder containing the txt files of the ground truths;
+        detDirectory: folder containing the txt files of the detections;
+        gtFormat, detFormat: BBFormat of the coordinates in the files of each folder;
+        gtCoordType, detCoordType: CoordinatesType of the coordinates in the files of each
+        folder;
+        imgSize (optional): (width, height) of the images. Required for relative coordinates;
+        batchSize (optional): number of images parsed at once (default = 1000);
+        minConfidence, maxDets, maxDetsPerClass (optional): detections discarded while reading
+        (see selectDetections).
+    Yields:
+        (imageName, groundTruths, detections) for each image, where groundTruths and
+        detections are given as in StreamingEvaluator.addImageColumns.
+    """
+    gtFiles = {os.path.basename(f).replace('.txt', ''): f for f in listFiles(gtDirectory)}
+    detFiles = {os.path.basename(f).replace('.txt', ''): f for f in listFiles(detDirectory)}
+    imageNames = sorted(set(gtFiles) | set(detFiles))
+    for i in range(0, len(imageNames), batchSize):
+        batch = imageNames[i:i + batchSize]
+        gts = parseFiles([gtFiles[n] for n in batch if n in gtFiles], True, gtFormat,
+                         gtCoordType, imgSize)
+        dets = parseFiles([detFiles[n] for n in batch if n in detFiles], False, detFormat,
+                          detCoordType, imgSize)
+        dets = pruneDetections(dets, minConfidence, maxDets, maxDetsPerClass)
+        gtGroups = dict(zip(gts['image names'], _groupRows(gts)))
+        detGroups = dict(zip(dets['image names'], _groupRows(dets)))
+        for name in batch:
+            groundTruths = {
+                c: gts['coordinates'][rows]
+                for c, rows in gtGroups.get(name, {}).items()
+            }
+            detections = {
+                c: (dets['confidences'][rows], dets['coordinates'][rows])
+                for c, rows in detGroups.get(name, {}).items()
+            }
+            yield name, groundTruths, detections
+
+
+# Columns of the dictionaries returned by parseFiles saved as .npy files in the cache
+CACHED_COLUMNS = ['image ids', 'class ids', 'coordinates', 'confidences']
+
+
+def getCacheKey(directory, isGT, bbFormat, coordType, imgSize=None):
+    """Name of the cache entry of a folder read with the given options."""
+    options = [os.path.realpath(directory), isGT, bbFormat.name, coordType.name]
+    if coordType == CoordinatesType.Relative:
+        options.append(list(imgSize))
+    return hashlib.sha1(json.dumps(options).encode()).hexdigest()
+
+
+def getFilesFingerprint(files):
+    """Hash of the names, sizes and modification times of the files. It changes if any file is
+    added, removed or modified."""
+    digest = hashlib.sha1()
+    for f in files:
+        st = os.stat(f)
+        digest.update(('%s\0%d\0%d\n' % (os.path.basename(f), st.st_size, st.st_mtime_ns)).encode())
+    return digest.hexdigest()
+
+
+def loadCachedColumns(entryFolder, fingerprint):
+    """Load the columns saved by saveCachedColumns, memory-mapping the arrays. Returns None if
+    the entry does not exist or was saved for files with another fingerprint."""
+    try:
+        with open(os.path.join(entryFolder, 'names.json'), 'r') as f:
+            names = json.load(f)
+        if names['fingerprint'] != fingerprint:
+            return None
+        columns = {
+            c: np.load(os.path.join(entryFolder, c.replace(' ', '_') + '.npy'), mmap_mode='r')
+            for c in CACHED_COLUMNS
+        }
+    except (OSError, ValueError, KeyError):
+        return None
+    columns['image names'] = names['image names']
+    columns['class names'] = names['class names']
+    return columns
+
+
+def saveCachedColumns(entryFolder, columns, fingerprint):
+    """Save the columns returned by parseFiles into a cache entry. The entry is written in a
+    temporary folder and then renamed, so readers never see a partial entry."""
+    parentFolder = os.path.dirname(entryFolder)
+    os.makedirs(parentFolder, exist_ok=True)
+    tempFolder = tempfile.mkdtemp(dir=parentFolder)
+    try:
+        for c in CACHED_COLUMNS:
+            np.save(os.path.join(tempFolder, c.replace(' ', '_') + '.npy'),
+                    np.ascontiguousarray(columns[c]))
+        with open(os.path.join(tempFolder, 'names.json'), 'w') as f:
+            json.dump(
+                {
+                    'fingerprint': fingerprint,
+                    'image names': columns['image names'],
+                    'class names': columns['class names']
+                }, f)
+        # Replace an outdated entry
+        shutil.rmtree(entryFolder, ignore_errors=True)
+        os.rename(tempFolder, entryFolder)
+    except OSError:
+        # Another process may have written the entry first: the cache is only an optimization
+        shutil.rmtree(tempFolder, ignore_errors=True)
+
+
+def loadBoundingBoxes(directory,
+                      isGT,
+                      bbFormat,
+                      coordType,
+                      allBoundingBoxes=None,
+                      imgSize=None,
+                      workers=1,
+                      cacheFolder=None,
+                      minConfidence=None,
+                      maxDets=None,
+                      maxDetsPerClass=False):
+    """Read all txt files of a folder into a ColumnarBoundingBoxes.
+    Args:
+        directory: folder containing the txt files (one per image);
+        isGT: True if the files contain ground truths, False if they contain detections;
+        bbFormat: BBFormat of the coordinates in the files;
+        coordType: CoordinatesType of the coordinates in the files;
+        allBoundingBoxes (optional): ColumnarBoundingBoxes where the boxes are added. If not
+        informed, a new one is created;
+        imgSize (optional): (width, height) of the images. Required for relative coordinates;
+        workers (optional): number of processes parsing the files (default = 1);
+        cacheFolder (optional): if informed, the parsed columns are saved in this folder and
+        loaded from it (memory-mapped) in the next calls with the same folder and options, as
+        long as no file of the folder was added, removed or modified. Unless detections are
+        discarded, the mapped arrays become the columns of a new allBoundingBoxes without being
+        copied; added to boxes already read, they are copied once. The cache keeps all
+        detections, so changing the options below does not invalidate it;
+        minConfidence, maxDets, maxDetsPerClass (optional): detections discarded before being
+        added to allBoundingBoxes (see selectDetections). Ignored for ground truths.
+    Returns:
+        allBoundingBoxes: ColumnarBoundingBoxes containing the bounding boxes read;
+        stats: dictionary with the number of 'files' and 'boxes' read, the number of boxes
+        'discarded', the 'seconds' taken, the throughput in 'boxes per second' and whether the
+        boxes were read from the cache ('cached').
+    """
+    start = time.perf_counter()
+    if allBoundingBoxes is None:
+        allBoundingBoxes = ColumnarBoundingBoxes()
+    files = listFiles(directory)
+    columns = None
+    if cacheFolder is not None:
+        entryFolder = os.path.join(cacheFolder,
+                                   getCacheKey(directory, isGT, bbFormat, coordType, imgSize))
+        fingerprint = getFilesFingerprint(files)
+        columns = loadCachedColumns(entryFolder, fingerprint)
+    cached = columns is not None
+    if not cached:
+        columns = parseFilesParallel(files, isGT, bbFormat, coordType, imgSize, workers)
+        if cacheFolder is not None:
+            saveCachedColumns(entryFolder, columns, fingerprint)
+    boxes = len(columns['class ids'])
+    if not isGT:
+        columns = pruneDetections(columns, minConfidence, maxDets, maxDetsPerClass)
+    allBoundingBoxes.addEncodedColumns(columns['class names'], columns['image names'],
+                                       columns['class ids'], columns['image ids'],
+                                       columns['coordinates'],
+                                       BBType.GroundTruth if isGT else BBType.Detected,
+                                       columns['confidences'])
+    seconds = time.perf_counter() - start
+    stats = {
+        'files': len(files),
+        'boxes': boxes,
+        'discarded': boxes - len(columns['class ids']),
+        'seconds': seconds,
+        'boxes per second': boxes / seconds if seconds > 0 else float('inf'),
+        'cached': cached
+    }
+    return allBoundingBoxes, stats
@@ -10,21 +10,38 @@
 
 import os
 import sys
+import time
 from collections import Counter
 
-import matplotlib.pyplot as plt
 import numpy as np
 
 from BoundingBox import *
 from BoundingBoxes import *
+from ColumnarBoundingBoxes import *
+from Profiler import *
+from SpatialIndex import *
 from utils import *
 
 
 class Evaluator:
+    def __init__(self, profiler=None):
+        """Constructor.
+        Args:
+            profiler (optional): Profiler collecting the time spent in each stage (indexing,
+            sorting, matching, AP and plotting) and counters of the work done (detections, ground
+            truths, and pairs of a detection and a ground truth of the same image whose IOU was
+            computed or skipped by the matching engine). If not informed, nothing is collected.
+        """
+        self._profiler = NullProfiler() if profiler is None else profiler
+
     def GetPascalVOCMetrics(self,
                             boundingboxes,
                             IOUThreshold=0.5,
-                            method=MethodAveragePrecision.EveryPointInterpolation):
+                            method=MethodAveragePrecision.EveryPointInterpolation,
+                            engine=MatchingEngine.Scalar,
+                            workers=1,
+                            executor=ExecutorType.Process,
+                            groundTruths=None):
         """Get the metrics used by the VOC Pascal 2012 challenge.
         Get
         Args:
@@ -36,6 +53,19 @@ class Evaluator:
             in the official PASCAL VOC toolkit (EveryPointInterpolation), or applying the 11-point
             interpolatio as described in the paper "The PASCAL Visual Object Classes(VOC) Challenge"
             or EveryPointInterpolation"  (ElevenPointInterpolation);
+            engine (default = Scalar): MatchingEngine used to match detections to ground truths.
+            MatchingEngine.Vectorized computes the IOU matrix of each image with NumPy and yields
+            the same results as the Scalar engine. MatchingEngine.SpatialIndex also yields the
+            same results, but only computes the IOUs of the pairs that may reach IOUThreshold,
+            which is faster for images with many ground truths;
+            workers (default = 1): number of workers evaluating the classes in parallel. Classes
+            with more detections than the average load of a worker are also split into shards of
+            images matched by different workers;
+            executor (default = Process): ExecutorType of the pool of workers (processes or
+            threads);
+            groundTruths (optional): ground truths grouped by Evaluator.GetGroundTruthIndex, to
+            evaluate several sets of detections of the same images without grouping their ground
+            truths again. If informed, the ground truths of boundingboxes are ignored;
         Returns:
             A list of dictionaries. Each dictionary contains information and metrics of each class.
             The keys of each dictionary are:
@@ -50,104 +80,982 @@ class Evaluator:
             dict['total FP']: total number of False Positive detections;
         """
         ret = []  # list containing metrics (precision, recall, average precision) of each class
-        # List with all ground truths (Ex: [imageName,class,confidence=1, (bb coordinates XYX2Y2)])
-        groundTruths = []
-        # List with all detections (Ex: [imageName,class,confidence,(bb coordinates XYX2Y2)])
-        detections = []
-        # Get all classes
-        classes = []
-        # Loop through all bounding boxes and separate them into GTs and detections
-        for bb in boundingboxes.getBoundingBoxes():
-            # [imageName, class, confidence, (bb coordinates XYX2Y2)]
-            if bb.getBBType() == BBType.GroundTruth:
-                groundTruths.append([
-                    bb.getImageName(),
-                    bb.getClassId(), 1,
-                    bb.getAbsoluteBoundingBox(BBFormat.XYX2Y2)
-                ])
-            else:
-                detections.append([
-                    bb.getImageName(),
-                    bb.getClassId(),
-                    bb.getConfidence(),
-                    bb.getAbsoluteBoundingBox(BBFormat.XYX2Y2)
-                ])
-            # get class
-            if bb.getClassId() not in classes:
-                classes.append(bb.getClassId())
-        classes = sorted(classes)
+        profiler = self._profiler
+        # Group ground truths and detections by class and image in a single pass
+        with profiler.timer('index'):
+            classes, index = Evaluator._indexBoundingBoxes(boundingboxes, groundTruths)
+        if workers is not None and workers > 1 and len(classes) > 0:
+            # Classes are evaluated by other workers, so only the total time is known
+            with profiler.timer('evaluate classes (parallel)'):
+                return Evaluator._evaluateClassesParallel(classes, index, IOUThreshold, method,
+                                                          engine, workers, executor, profiler)
         # Precision x Recall is obtained individually by each class
         # Loop through by classes
         for c in classes:
-            # Get only detection of class c
-            dects = []
-            [dects.append(d) for d in detections if d[1] == c]
-            # Get only ground truths of class c, use filename as key
-            gts = {}
-            npos = 0
-            for g in groundTruths:
-                if g[1] == c:
-                    npos += 1
-                    gts[g[0]] = gts.get(g[0], []) + [g]
-
-            # sort detections by decreasing confidence
-            dects = sorted(dects, key=lambda conf: conf[2], reverse=True)
-            TP = np.zeros(len(dects))
-            FP = np.zeros(len(dects))
-            # create dictionary with amount of gts for each image
-            det = {key: np.zeros(len(gts[key])) for key in gts}
-
-            # print("Evaluating class: %s (%d detections)" % (str(c), len(dects)))
-            # Loop through detections
-            for d in range(len(dects)):
-                # print('dect %s => %s' % (dects[d][0], dects[d][3],))
-                # Find ground truth image
-                gt = gts[dects[d][0]] if dects[d][0] in gts else []
-                iouMax = sys.float_info.min
-                for j in range(len(gt)):
-                    # print('Ground truth gt => %s' % (gt[j][3],))
-                    iou = Evaluator.iou(dects[d][3], gt[j][3])
-                    if iou > iouMax:
-                        iouMax = iou
-                        jmax = j
-                # Assign detection as true positive/don't care/false positive
-                if iouMax >= IOUThreshold:
-                    if det[dects[d][0]][jmax] == 0:
-                        TP[d] = 1  # count as true positive
-                        det[dects[d][0]][jmax] = 1  # flag as already 'seen'
-                        # print("TP")
-                    else:
-                        FP[d] = 1  # count as false positive
-                        # print("FP")
-                # - A detected "cat" is overlaped with a GT "cat" with IOU >= IOUThreshold.
-                else:
-                    FP[d] = 1  # count as false positive
-                    # print("FP")
-            # compute precision, recall and average precision
-            acc_FP = np.cumsum(FP)
-            acc_TP = np.cumsum(TP)
-            rec = acc_TP / npos
-            prec = np.divide(acc_TP, (acc_FP + acc_TP))
-            # Depending on the method, call the right implementation
-            if method == MethodAveragePrecision.EveryPointInterpolation:
-                [ap, mpre, mrec, ii] = Evaluator.CalculateAveragePrecision(rec, prec)
+            if profiler.enabled:
+                r = self._evaluateClassProfiled(c, index[c], IOUThreshold, method, engine)
             else:
-                [ap, mpre, mrec, _] = Evaluator.ElevenPointInterpolatedAP(rec, prec)
-            # add class result in the dictionary to be returned
-            r = {
+                r, _, _ = Evaluator._evaluateClass(c, index[c], IOUThreshold, method, engine)
+            ret.append(r)
+        return ret
+
+    def GetGroundTruthIndex(self, boundingboxes):
+        """Group the ground truths by class and image once, so that several sets of detections
+        of the same images can be evaluated against them (see the groundTruths argument of
+        GetPascalVOCMetrics).
+        Args:
+            boundingboxes: Object of the class BoundingBoxes (or ColumnarBoundingBoxes) with the
+            ground truths. Its detections, if any, are ignored.
+        Returns:
+            A dictionary with the keys:
+            dict['classes']: dictionary mapping each class to a dictionary with the keys
+            'groundTruths' and 'total positives' (see Evaluator._indexBoundingBoxes);
+            dict['image index']: for a ColumnarBoundingBoxes, dictionary mapping each image name
+            to the image id used in 'groundTruths' (None for a BoundingBoxes, whose
+            'groundTruths' use the image names).
+        """
+        with self._profiler.timer('index'):
+            classes, index = Evaluator._indexBoundingBoxes(boundingboxes)
+        imageIndex = None
+        if isinstance(boundingboxes, ColumnarBoundingBoxes):
+            imageNames = boundingboxes.getColumns()['image names']
+            imageIndex = {name: i for i, name in enumerate(imageNames)}
+        return {
+            'classes': {
+                c: {
+                    'groundTruths': index[c]['groundTruths'],
+                    'total positives': index[c]['total positives']
+                }
+                for c in classes if index[c]['total positives'] > 0
+            },
+            'image index': imageIndex
+        }
+
+    def GetMultiThresholdMetrics(self,
+                                 boundingboxes,
+                                 IOUThresholds=None,
+                                 method=MethodAveragePrecision.EveryPointInterpolation):
+        """Get the average precision of each class for several IOU thresholds (COCO style).
+        The IOU matrix of each image is computed only once: for each detection, the ground truth
+        with the highest IOU does not depend on the threshold, so only the greedy assignment is
+        repeated for each threshold. The results are the same as calling GetPascalVOCMetrics
+        once per threshold.
+        Args:
+            boundingboxes: Object of the class BoundingBoxes (or ColumnarBoundingBoxes)
+            representing ground truth and detected bounding boxes;
+            IOUThresholds (optional): IOU thresholds to evaluate (default = 0.50:0.05:0.95);
+            method (default = EveryPointInterpolation): method used to calculate the average
+            precision (see GetPascalVOCMetrics).
+        Returns:
+            A dictionary with the keys:
+            dict['thresholds']: array with the IOU thresholds;
+            dict['classes']: list with one dictionary per class, with the keys 'class', 'AP'
+            (array with the AP of each threshold), 'total positives', 'total TP' and 'total FP'
+            (arrays with the totals of each threshold);
+            dict['mAP']: array with the mean AP of the classes with ground truths for each
+            threshold;
+            dict['mean mAP']: mean of dict['mAP'] over all thresholds (mAP@[.5:.95] for the
+            default thresholds).
+        """
+        if IOUThresholds is None:
+            IOUThresholds = np.linspace(0.5, 0.95, 10)
+        IOUThresholds = np.asarray(IOUThresholds, dtype=np.float64).reshape(-1)
+        profiler = self._profiler
+        with profiler.timer('index'):
+            classes, index = Evaluator._indexBoundingBoxes(boundingboxes)
+        ret = []
+        for c in classes:
+            classData = index[c]
+            npos = classData['total positives']
+            with profiler.timer('sort', c):
+                images, boxes = Evaluator._sortDetections(classData)
+            with profiler.timer('match', c):
+                ious, gtKeys, pairs, skipped = Evaluator._getBestMatches(
+                    images, boxes, classData['groundTruths'])
+            if profiler.enabled:
+                Evaluator._countMatches(profiler, classData, pairs, skipped)
+            ap = np.zeros(len(IOUThresholds))
+            totalTP = np.zeros(len(IOUThresholds))
+            totalFP = np.zeros(len(IOUThresholds))
+            for t, threshold in enumerate(IOUThresholds):
+                with profiler.timer('match', c):
+                    TP, FP = Evaluator._assignMatches(ious, gtKeys, threshold)
+                with profiler.timer('AP', c):
+                    r = Evaluator._getClassMetrics(c, TP, FP, npos, method)
+                ap[t] = r['AP']
+                totalTP[t] = r['total TP']
+                totalFP[t] = r['total FP']
+            ret.append({
                 'class': c,
-                'precision': prec,
-                'recall': rec,
                 'AP': ap,
-                'interpolated precision': mpre,
-                'interpolated recall': mrec,
                 'total positives': npos,
-                'total TP': np.sum(TP),
-                'total FP': np.sum(FP)
+                'total TP': totalTP,
+                'total FP': totalFP
+            })
+        validAPs = [r['AP'] for r in ret if r['total positives'] > 0]
+        if len(validAPs) > 0:
+            mAP = np.mean(validAPs, axis=0)
+        else:
+            mAP = np.full(len(IOUThresholds), np.nan)
+        return {
+            'thresholds': IOUThresholds,
+            'classes': ret,
+            'mAP': mAP,
+            'mean mAP': np.mean(mAP) if len(mAP) > 0 else np.nan
+        }
+
+    def GetImageMatches(self,
+                        boundingboxes,
+                        IOUThreshold=0.5,
+                        engine=MatchingEngine.Scalar):
+        """Match the detections to the ground truths once, keeping what is needed to compute the
+        metrics of any resampling of the images without matching again: whether a detection is
+        a TP only depends on the boxes of its own image.
+        Args:
+            boundingboxes: Object of the class BoundingBoxes (or ColumnarBoundingBoxes)
+            representing ground truth and detected bounding boxes;
+            IOUThreshold, engine (optional): see GetPascalVOCMetrics.
+        Returns:
+            A dictionary with the keys:
+            dict['images']: names of the images with bounding boxes, which are resampled;
+            dict['classes']: sorted list with all classes;
+            dict['detections']: dictionary mapping each class to a dictionary with the
+            positions in dict['images'] ('images'), the 'confidences' and the 'TP' flags of its
+            detections, sorted by decreasing confidence;
+            dict['positives']: dictionary mapping each class to an array with its number of
+            ground truths in each image of dict['images'].
+        """
+        with self._profiler.timer('index'):
+            classes, index = Evaluator._indexBoundingBoxes(boundingboxes)
+        columnar = isinstance(boundingboxes, ColumnarBoundingBoxes)
+        # The image ids of a ColumnarBoundingBoxes are positions in its table of image names
+        imageNames = list(boundingboxes.getColumns()['image names']) if columnar else []
+        imageIndex = {}
+
+        def getPositions(images):
+            if columnar:
+                return np.asarray(images, dtype=np.int64)
+            for name in images:
+                if name not in imageIndex:
+                    imageIndex[name] = len(imageNames)
+                    imageNames.append(name)
+            return np.array([imageIndex[name] for name in images], dtype=np.int64)
+
+        detections = {}
+        gtImages = {}
+        for c in classes:
+            classData = index[c]
+            with self._profiler.timer('sort', c):
+                order = Evaluator.getConfidenceOrder(classData['confidences'])
+                images, boxes = Evaluator._sortDetections(classData, order)
+            with self._profiler.timer('match', c):
+                TP, _, pairs, skipped = Evaluator._matchClass(images, boxes,
+                                                              classData['groundTruths'],
+                                                              IOUThreshold, engine)
+            if self._profiler.enabled:
+                Evaluator._countMatches(self._profiler, classData, pairs, skipped)
+            detections[c] = {
+                'images': getPositions(images),
+                'confidences': np.asarray(classData['confidences'], dtype=np.float64)[order],
+                'TP': np.asarray(TP, dtype=bool)
             }
-            ret.append(r)
+            gts = classData['groundTruths']
+            gtImages[c] = (getPositions(list(gts)), np.array([len(b) for b in gts.values()]))
+        positives = {}
+        for c in classes:
+            positives[c] = np.zeros(len(imageNames), dtype=np.int64)
+            positives[c][gtImages[c][0]] = gtImages[c][1]
+        return {
+            'images': imageNames,
+            'classes': classes,
+            'detections': detections,
+            'positives': positives
+        }
+
+    @staticmethod
+    def _getWeightedAPs(TP, weights, positives, method):
+        """Average precision of a class for several weightings of its detections, where a
+        detection with weight k counts as k copies of it (as in a resampling of the images).
+        With all weights equal to 1, the result is the same as Evaluator._getClassMetrics.
+        Args:
+            TP: TP flags of the detections, sorted by decreasing confidence;
+            weights: (R, N) array with the weight of each detection in each weighting;
+            positives: array with the number of ground truths in each weighting.
+        Returns:
+            Array with the AP of each weighting (NaN if it has no ground truths).
+        """
+        positives = np.asarray(positives, dtype=np.float64).reshape(-1)
+        weights = np.asarray(weights, dtype=np.float64).reshape(len(positives), -1)
+        return Evaluator._getAccumulatedAPs(np.cumsum(weights * TP, axis=1),
+                                            np.cumsum(weights, axis=1), positives, method)
+
+    @staticmethod
+    def _getAccumulatedAPs(accTP, accAll, positives, method):
+        """Same as _getWeightedAPs, from the cumulative sums of the weights of the TP detections
+        (accTP) and of all detections (accAll), both (R, N) arrays."""
+        positives = np.asarray(positives, dtype=np.float64).reshape(-1)
+        ap = np.zeros(len(positives))
+        if accAll.shape[1] > 0:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rec = accTP / positives[:, None]
+                # Leading detections with weight 0 have no precision: they do not change the AP
+                prec = np.where(accAll > 0, accTP / accAll, 0)
+            # maximum precision at each recall or above (precision envelope)
+            envelope = np.maximum.accumulate(prec[:, ::-1], axis=1)[:, ::-1]
+            if method == MethodAveragePrecision.EveryPointInterpolation:
+                # Same sums as CalculateAveragePrecision (a recall that does not change adds 0)
+                dRec = np.diff(rec, axis=1, prepend=0)
+                ap = np.cumsum(dRec * envelope, axis=1)[:, -1]
+            else:
+                rows = np.arange(len(positives))
+                for r in np.linspace(0, 1, 11)[::-1]:
+                    # Recalls are non-decreasing: first position whose recall reaches r
+                    first = np.count_nonzero(rec < r, axis=1)
+                    ap = ap + np.where(first < rec.shape[1],
+                                       envelope[rows, np.minimum(first, rec.shape[1] - 1)], 0)
+                ap = ap / 11
+        return np.where(positives > 0, ap, np.nan)
+
+    def GetBootstrapMetrics(self,
+                            boundingboxes,
+                            IOUThreshold=0.5,
+                            method=MethodAveragePrecision.EveryPointInterpolation,
+                            resamples=1000,
+                            confidenceLevel=0.95,
+                            seed=None,
+                            engine=MatchingEngine.Scalar,
+                            matches=None):
+        """Bootstrap confidence intervals of the AP of each class and of the mAP.
+        The images are resampled with replacement: each resampling is a vector with the number
+        of times each image is drawn, and the AP of each class is computed from the detections
+        matched once (see GetImageMatches) weighted by the draws of their images, for many
+        resamplings at once. Copies of a detection are counted together, as if they were
+        adjacent in the order of confidence.
+        Args:
+            boundingboxes: Object of the class BoundingBoxes (or ColumnarBoundingBoxes)
+            representing ground truth and detected bounding boxes;
+            IOUThreshold, method, engine (optional): see GetPascalVOCMetrics;
+            resamples (optional): number of resamplings of the images (default = 1000);
+            confidenceLevel (optional): probability covered by the intervals (default = 0.95);
+            seed (optional): seed of the random resamplings;
+            matches (optional): result of GetImageMatches for boundingboxes, if already
+            computed.
+        Returns:
+            A dictionary with the keys:
+            dict['classes']: list with one dictionary per class, with the keys 'class', 'AP',
+            'AP lower', 'AP upper' (bounds of the interval), 'AP samples' (AP of each
+            resampling, NaN if it has no ground truths of the class) and 'total positives';
+            dict['mAP'], dict['mAP lower'], dict['mAP upper'], dict['mAP samples']: the same
+            for the mean AP of the classes with ground truths;
+            dict['resamples'], dict['confidence level']: parameters used.
+        """
+        if matches is None:
+            matches = self.GetImageMatches(boundingboxes, IOUThreshold, engine)
+        classes = matches['classes']
+        nImages = len(matches['images'])
+        rng = np.random.default_rng(seed)
+        samples = np.full((resamples, len(classes)), np.nan)
+        largest = max([nImages] + [len(d['TP']) for d in matches['detections'].values()])
+        # Resamplings computed at once, keeping each (resamplings, detections) array small
+        chunk = max(1, min(resamples, (1 << 22) // max(largest, 1)))
+        with self._profiler.timer('bootstrap'):
+            for start in range(0, resamples, chunk):
+                n = min(chunk, resamples - start)
+                draws = rng.integers(0, nImages, size=(n, nImages)) if nImages > 0 else \
+                    np.empty((n, 0), dtype=np.int64)
+                offsets = (np.arange(n) * nImages)[:, None]
+                counts = np.bincount((draws + offsets).ravel(),
+                                     minlength=n * nImages).reshape(n, nImages)
+                for i, c in enumerate(classes):
+                    dets = matches['detections'][c]
+                    samples[start:start + n, i] = Evaluator._getWeightedAPs(
+                        dets['TP'], counts[:, dets['images']], counts @ matches['positives'][c],
+                        method)
+        ret = {'classes': [], 'resamples': resamples, 'confidence level': confidenceLevel}
+        bounds = [50 * (1 - confidenceLevel), 50 * (1 + confidenceLevel)]
+        aps = Evaluator._getMatchedAPs(matches, method)
+        for i, c in enumerate(classes):
+            lower, upper = Evaluator._getPercentiles(samples[:, i], bounds)
+            ret['classes'].append({
+                'class': c,
+                'AP': aps[i],
+                'AP lower': lower,
+                'AP upper': upper,
+                'AP samples': samples[:, i],
+                'total positives': int(matches['positives'][c].sum())
+            })
+        mAPSamples = Evaluator._getMeanAPs(samples)
+        ret['mAP'] = Evaluator._getMeanAPs(np.array([aps]))[0]
+        ret['mAP lower'], ret['mAP upper'] = Evaluator._getPercentiles(mAPSamples, bounds)
+        ret['mAP samples'] = mAPSamples
         return ret
 
+    def GetPairedTest(self,
+                      boundingboxesA,
+                      boundingboxesB,
+                      IOUThreshold=0.5,
+                      method=MethodAveragePrecision.EveryPointInterpolation,
+                      test=SignificanceTest.Permutation,
+                      iterations=1000,
+                      confidenceLevel=0.95,
+                      seed=None,
+                      engine=MatchingEngine.Scalar,
+                      matchesA=None,
+                      matchesB=None):
+        """Paired test of the difference of mAP between two sets of detections (A and B) of the
+        same images and ground truths.
+        Each set is matched once (see GetImageMatches). Their detections are merged by
+        confidence, and each iteration only changes the weight of each detection: a
+        permutation gives the detections of each image to A or to B at random, and a
+        bootstrap resampling draws the images with replacement for both sets. Among
+        detections with the same confidence, those of A come first.
+        Args:
+            boundingboxesA, boundingboxesB: Objects of the class BoundingBoxes (or
+            ColumnarBoundingBoxes) with the same ground truths and the detections of each set;
+            IOUThreshold, method, engine (optional): see GetPascalVOCMetrics;
+            test (optional): SignificanceTest used (default = Permutation);
+            iterations (optional): number of permutations or resamplings (default = 1000);
+            confidenceLevel (optional): probability covered by the interval of the difference
+            (default = 0.95);
+            seed (optional): seed of the random permutations or resamplings;
+            matchesA, matchesB (optional): results of GetImageMatches for each set, if already
+            computed.
+        Returns:
+            A dictionary with the keys:
+            dict['mAP A'], dict['mAP B']: mAP of each set;
+            dict['difference']: mAP A - mAP B;
+            dict['p-value']: two-sided p-value of the null hypothesis that both sets have the
+            same mAP;
+            dict['difference lower'], dict['difference upper']: bounds of the interval of the
+            difference (bootstrap only, NaN for the permutation test);
+            dict['difference samples']: difference of each iteration;
+            dict['classes']: list with one dictionary per class, with the keys 'class', 'AP A',
+            'AP B' and 'difference';
+            dict['test'], dict['iterations'], dict['confidence level']: parameters used.
+        """
+        if matchesA is None:
+            matchesA = self.GetImageMatches(boundingboxesA, IOUThreshold, engine)
+        if matchesB is None:
+            matchesB = self.GetImageMatches(boundingboxesB, IOUThreshold, engine)
+        merged = Evaluator._mergeMatches(matchesA, matchesB)
+        classes = merged['classes']
+        nImages = len(merged['images'])
+        rng = np.random.default_rng(seed)
+        samples = np.full((iterations, 2, len(classes)), np.nan)
+        largest = max([nImages] + [len(d['TP']) for d in merged['detections'].values()])
+        chunk = max(1, min(iterations, (1 << 22) // max(largest, 1)))
+        with self._profiler.timer('paired test'):
+            for start in range(0, iterations, chunk):
+                n = min(chunk, iterations - start)
+                if test == SignificanceTest.Permutation:
+                    # 1 where the detections of B are given to the first side
+                    swaps = rng.integers(0, 2, size=(n, nImages)).astype(np.float64)
+                else:
+                    draws = rng.integers(0, nImages, size=(n, nImages))
+                    counts = np.bincount((draws + (np.arange(n) * nImages)[:, None]).ravel(),
+                                         minlength=n * nImages).reshape(n, nImages)
+                for i, c in enumerate(classes):
+                    dets = merged['detections'][c]
+                    if test == SignificanceTest.Permutation:
+                        # Each detection goes to one side: the sums of the second side are the
+                        # sums of all detections minus those of the first (exact integers)
+                        weights = swaps[:, dets['images']]
+                        weights[:, ~dets['from B']] = 1 - weights[:, ~dets['from B']]
+                        accTP = np.cumsum(weights * dets['TP'], axis=1)
+                        accAll = np.cumsum(weights, axis=1)
+                        positives = np.full(n, merged['positives'][c].sum())
+                        sides = [(accTP, accAll),
+                                 (np.cumsum(dets['TP']) - accTP,
+                                  np.arange(1, len(dets['TP']) + 1) - accAll)]
+                    else:
+                        # Each side only needs its own detections
+                        positives = counts @ merged['positives'][c]
+                        sides = []
+                        for selected in [~dets['from B'], dets['from B']]:
+                            weights = counts[:, dets['images'][selected]]
+                            sides.append((np.cumsum(weights * dets['TP'][selected], axis=1),
+                                          np.cumsum(weights, axis=1)))
+                    for side, (accTP, accAll) in enumerate(sides):
+                        samples[start:start + n, side, i] = Evaluator._getAccumulatedAPs(
+                            accTP, accAll, positives, method)
+        apsA = Evaluator._getMatchedAPs(matchesA, method)
+        apsB = Evaluator._getMatchedAPs(matchesB, method)
+        classesA = dict(zip(matchesA['classes'], apsA))
+        classesB = dict(zip(matchesB['classes'], apsB))
+        mAPA = Evaluator._getMeanAPs(np.array([apsA]))[0]
+        mAPB = Evaluator._getMeanAPs(np.array([apsB]))[0]
+        difference = mAPA - mAPB
+        diffSamples = Evaluator._getMeanAPs(samples[:, 0]) - Evaluator._getMeanAPs(samples[:, 1])
+        ret = {
+            'mAP A': mAPA,
+            'mAP B': mAPB,
+            'difference': difference,
+            'difference samples': diffSamples,
+            'difference lower': np.nan,
+            'difference upper': np.nan,
+            'classes': [{
+                'class': c,
+                'AP A': classesA.get(c, np.nan),
+                'AP B': classesB.get(c, np.nan),
+                'difference': classesA.get(c, np.nan) - classesB.get(c, np.nan)
+            } for c in classes],
+            'test': test,
+            'iterations': iterations,
+            'confidence level': confidenceLevel
+        }
+        valid = diffSamples[~np.isnan(diffSamples)]
+        if test == SignificanceTest.Permutation:
+            # Permutations at least as extreme as the observed difference (the observed one
+            # counts as a permutation); a small tolerance absorbs rounding differences
+            extreme = np.count_nonzero(np.abs(valid) >= abs(difference) - 1e-12)
+            ret['p-value'] = (extreme + 1) / (len(valid) + 1)
+        else:
+            ret['difference lower'], ret['difference upper'] = Evaluator._getPercentiles(
+                diffSamples, [50 * (1 - confidenceLevel), 50 * (1 + confidenceLevel)])
+            # Twice the fraction of resamplings on the smaller side of 0
+            below = np.count_nonzero(valid <= 0) / max(len(valid), 1)
+            above = np.count_nonzero(valid >= 0) / max(len(valid), 1)
+            ret['p-value'] = min(1.0, 2 * min(below, above))
+        return ret
+
+    @staticmethod
+    def _mergeMatches(matchesA, matchesB):
+        """Merge the results of GetImageMatches of two sets of detections of the same ground
+        truths: images are identified by name, and the detections of each class are merged by
+        decreasing confidence, with a 'from B' flag."""
+        images = list(matchesA['images'])
+        imageIndex = {name: i for i, name in enumerate(images)}
+        for name in matchesB['images']:
+            if name not in imageIndex:
+                imageIndex[name] = len(images)
+                images.append(name)
+        # Positions in the merged images of the images of B
+        positionsB = np.array([imageIndex[name] for name in matchesB['images']], dtype=np.int64)
+        classes = sorted(set(matchesA['classes']) | set(matchesB['classes']))
+        detections = {}
+        positives = {}
+        empty = {'images': np.empty(0, dtype=np.int64), 'confidences': np.empty(0),
+                 'TP': np.empty(0, dtype=bool)}
+        for c in classes:
+            positivesA = np.zeros(len(images), dtype=np.int64)
+            positivesB = np.zeros(len(images), dtype=np.int64)
+            if c in matchesA['positives']:
+                positivesA[:len(matchesA['images'])] = matchesA['positives'][c]
+            if c in matchesB['positives']:
+                positivesB[positionsB] = matchesB['positives'][c]
+            if not np.array_equal(positivesA, positivesB):
+                raise IOError('The two sets of detections do not have the same ground truths '
+                              '(class %s)' % str(c))
+            positives[c] = positivesA
+            detsA = matchesA['detections'].get(c, empty)
+            detsB = matchesB['detections'].get(c, empty)
+            order = Evaluator.mergeSortedShards([detsA['confidences'], detsB['confidences']])
+            detections[c] = {
+                'images': np.concatenate((detsA['images'], positionsB[detsB['images']]))[order],
+                'TP': np.concatenate((detsA['TP'], detsB['TP']))[order],
+                'from B': (np.arange(len(order)) >= len(detsA['TP']))[order]
+            }
+        return {
+            'images': images,
+            'classes': classes,
+            'detections': detections,
+            'positives': positives
+        }
+
+    @staticmethod
+    def _getMatchedAPs(matches, method):
+        """AP of each class of the result of GetImageMatches (NaN without ground truths)."""
+        aps = []
+        for c in matches['classes']:
+            TP = matches['detections'][c]['TP'].astype(np.float64)
+            npos = int(matches['positives'][c].sum())
+            aps.append(Evaluator._getClassMetrics(c, TP, 1 - TP, npos, method)['AP']
+                       if npos > 0 else np.nan)
+        return aps
+
+    @staticmethod
+    def _getMeanAPs(aps):
+        """Mean of each row of an array of APs, ignoring NaN (classes without ground truths)."""
+        aps = np.asarray(aps, dtype=np.float64)
+        valid = ~np.isnan(aps)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(valid, aps, 0).sum(axis=1) / valid.sum(axis=1)
+
+    @staticmethod
+    def _getPercentiles(samples, percentiles):
+        """Percentiles of the samples that are not NaN (NaN if there is none)."""
+        samples = samples[~np.isnan(samples)]
+        if len(samples) == 0:
+            return [np.nan] * len(percentiles)
+        return np.percentile(samples, percentiles).tolist()
+
+    @staticmethod
+    def _evaluateClassesParallel(classes, index, IOUThreshold, method, engine, workers,
+                                 executor, profiler):
+        """Evaluate the classes with a pool of workers. Small classes are evaluated by a single
+        worker; the matching of large classes is split into shards of images. The results are
+        returned in the order of classes, and the pairs matched by the workers are added to the
+        counters of profiler."""
+        poolClass = getPoolExecutor(executor)
+        totalDetections = sum(len(index[c]['confidences']) for c in classes)
+        loadPerWorker = max(1, -(-totalDetections // workers))
+        ret = []
+        with poolClass(max_workers=workers) as pool:
+            tasks = []
+            for c in classes:
+                classData = index[c]
+                nShards = min(workers, len(classData['confidences']) // loadPerWorker)
+                if nShards < 2:
+                    tasks.append(
+                        pool.submit(Evaluator._evaluateClass, c, classData, IOUThreshold, method,
+                                    engine))
+                    continue
+                images, boxes = Evaluator._sortDetections(classData)
+                shards = []
+                for idx, shardImages, shardBoxes, shardGts in Evaluator._shardByImage(
+                        images, boxes, classData['groundTruths'], nShards):
+                    shards.append((idx,
+                                   pool.submit(Evaluator._matchClass, shardImages, shardBoxes,
+                                               shardGts, IOUThreshold, engine)))
+                tasks.append(shards)
+            for c, task in zip(classes, tasks):
+                if not isinstance(task, list):
+                    r, pairs, skipped = task.result()
+                else:
+                    # Put the TP/FP flags of each shard back in the order of confidence
+                    TP = np.zeros(len(index[c]['confidences']))
+                    FP = np.zeros(len(index[c]['confidences']))
+                    pairs = 0
+                    skipped = 0
+                    for idx, future in task:
+                        TP[idx], FP[idx], shardPairs, shardSkipped = future.result()
+                        pairs += shardPairs
+                        skipped += shardSkipped
+                    r = Evaluator._getClassMetrics(c, TP, FP, index[c]['total positives'],
+                                                   method)
+                if profiler.enabled:
+                    Evaluator._countMatches(profiler, index[c], pairs, skipped)
+                ret.append(r)
+        return ret
+
+    @staticmethod
+    def _shardByImage(images, boxes, gts, nShards):
+        """Split detections (sorted by decreasing confidence) into nShards groups of images.
+        Returns a list with, for each shard, the positions of its detections and its images,
+        boxes and ground truths. Detections keep their order inside each shard."""
+        if isinstance(images, np.ndarray):
+            imageIds = np.unique(images, return_inverse=True)[1].reshape(-1)
+        else:
+            imageIndex = {}
+            imageIds = np.array([imageIndex.setdefault(i, len(imageIndex)) for i in images],
+                                dtype=np.int64)
+        shardIds = imageIds % nShards
+        shards = []
+        for s in range(nShards):
+            idx = np.flatnonzero(shardIds == s)
+            if isinstance(images, np.ndarray):
+                shardImages = images[idx]
+                shardBoxes = boxes[idx]
+            else:
+                shardImages = [images[d] for d in idx]
+                shardBoxes = [boxes[d] for d in idx]
+            shardGts = {i: gts[i] for i in set(shardImages) if i in gts}
+            shards.append((idx, shardImages, shardBoxes, shardGts))
+        return shards
+
+    @staticmethod
+    def _indexBoundingBoxes(boundingboxes, groundTruths=None):
+        """Group all bounding boxes by class (and ground truths by image) in a single pass.
+        Args:
+            boundingboxes: Object of the class BoundingBoxes (or ColumnarBoundingBoxes)
+            representing ground truth and detected bounding boxes;
+            groundTruths (optional): ground truths already grouped by
+            Evaluator.GetGroundTruthIndex, used instead of those of boundingboxes.
+        Returns:
+            classes: sorted list with all classes;
+            index: dictionary mapping each class to a dictionary with the keys:
+            'images', 'confidences', 'boxes': image name, confidence and coordinates (XYX2Y2) of
+            each detection of the class, in their original order;
+            'groundTruths': dictionary mapping each image name to the coordinates (XYX2Y2) of
+            its ground truths of the class;
+            'total positives': total number of ground truths of the class.
+        """
+        columnar = isinstance(boundingboxes, ColumnarBoundingBoxes)
+        if groundTruths is not None and columnar != (groundTruths['image index'] is not None):
+            raise IOError('The ground truths were grouped from a different kind of bounding '
+                          'boxes (BoundingBoxes or ColumnarBoundingBoxes)')
+        if columnar:
+            return Evaluator._indexColumns(boundingboxes, groundTruths)
+        index = {}
+        for bb in boundingboxes.getBoundingBoxes():
+            c = bb.getClassId()
+            classData = index.get(c)
+            if classData is None:
+                classData = index[c] = {
+                    'images': [],
+                    'confidences': [],
+                    'boxes': [],
+                    'groundTruths': {},
+                    'total positives': 0
+                }
+            if bb.getBBType() == BBType.GroundTruth:
+                if groundTruths is None:
+                    classData['groundTruths'].setdefault(bb.getImageName(), []).append(
+                        bb.getAbsoluteBoundingBox(BBFormat.XYX2Y2))
+                    classData['total positives'] += 1
+            else:
+                classData['images'].append(bb.getImageName())
+                classData['confidences'].append(bb.getConfidence())
+                classData['boxes'].append(bb.getAbsoluteBoundingBox(BBFormat.XYX2Y2))
+        if groundTruths is not None:
+            Evaluator._addGroundTruthIndex(index, groundTruths, lambda: {
+                'images': [],
+                'confidences': [],
+                'boxes': []
+            })
+        return sorted(index), index
+
+    @staticmethod
+    def _addGroundTruthIndex(index, groundTruths, newClass):
+        """Set the ground truths of each class of index from the result of
+        Evaluator.GetGroundTruthIndex, adding the classes without detections (newClass returns
+        their empty detections)."""
+        for c, classData in groundTruths['classes'].items():
+            if c not in index:
+                index[c] = newClass()
+            index[c]['groundTruths'] = classData['groundTruths']
+            index[c]['total positives'] = classData['total positives']
+        for classData in index.values():
+            if 'groundTruths' not in classData:
+                classData['groundTruths'] = {}
+                classData['total positives'] = 0
+
+    @staticmethod
+    def _indexColumns(boundingboxes, groundTruths=None):
+        """Same as Evaluator._indexBoundingBoxes for a ColumnarBoundingBoxes, reading its columns
+        directly: image names are replaced by image ids and the lists by NumPy arrays."""
+        columns = boundingboxes.getColumns()
+        imageIds = columns['image ids']
+        coordinates = columns['coordinates']
+        isGT = columns['bb types'] == BBType.GroundTruth.value
+        if groundTruths is not None:
+            # Use the image ids of the ground truths (-1 for images without ground truths)
+            imageIndex = groundTruths['image index']
+            imageIds = np.array([imageIndex.get(name, -1) for name in columns['image names']],
+                                dtype=np.int64)[imageIds]
+        index = {}
+        for c in boundingboxes.getClasses():
+            rows = boundingboxes.getRowsByClass(c)
+            detRows = rows[~isGT[rows]]
+            index[c] = {
+                'images': imageIds[detRows],
+                'confidences': columns['confidences'][detRows],
+                'boxes': coordinates[detRows]
+            }
+            if groundTruths is not None:
+                continue
+            gtRows = rows[isGT[rows]]
+            # Group ground truths by image keeping their original order
+            gtRows = gtRows[np.argsort(imageIds[gtRows], kind='stable')]
+            images, starts = np.unique(imageIds[gtRows], return_index=True)
+            index[c]['groundTruths'] = {
+                image: coordinates[r]
+                for image, r in zip(images.tolist(), np.split(gtRows, starts[1:]))
+            }
+            index[c]['total positives'] = len(gtRows)
+        if groundTruths is not None:
+            Evaluator._addGroundTruthIndex(index, groundTruths, lambda: {
+                'images': np.empty(0, dtype=np.int64),
+                'confidences': np.empty(0),
+                'boxes': np.empty((0, 4))
+            })
+        return sorted(index), index
+
+    @staticmethod
+    def _evaluateClass(c, classData, IOUThreshold, method, engine):
+        """Compute the metrics of class c from its entry in the index built by
+        Evaluator._indexBoundingBoxes. Returns the dictionary described in GetPascalVOCMetrics
+        and the number of pairs evaluated and skipped by the matching (see _matchClass)."""
+        images, boxes = Evaluator._sortDetections(classData)
+        TP, FP, pairs, skipped = Evaluator._matchClass(images, boxes, classData['groundTruths'],
+                                                       IOUThreshold, engine)
+        return Evaluator._getClassMetrics(c, TP, FP, classData['total positives'],
+                                          method), pairs, skipped
+
+    def _evaluateClassProfiled(self, c, classData, IOUThreshold, method, engine):
+        """Same as Evaluator._evaluateClass, timing each step with the profiler and adding the
+        work done to its counters. Returns only the metrics."""
+        profiler = self._profiler
+        with profiler.timer('sort', c):
+            images, boxes = Evaluator._sortDetections(classData)
+        with profiler.timer('match', c):
+            TP, FP, pairs, skipped = Evaluator._matchClass(images, boxes,
+                                                           classData['groundTruths'],
+                                                           IOUThreshold, engine)
+        Evaluator._countMatches(profiler, classData, pairs, skipped)
+        with profiler.timer('AP', c):
+            return Evaluator._getClassMetrics(c, TP, FP, classData['total positives'], method)
+
+    @staticmethod
+    def _countMatches(profiler, classData, pairs, skipped):
+        """Add the number of detections and ground truths of an index entry and the pairs
+        evaluated and skipped by its matching (see _matchClass) to the counters of profiler."""
+        profiler.count('detections', len(classData['confidences']))
+        profiler.count('ground truths', classData['total positives'])
+        profiler.count('IOU evaluations', pairs)
+        profiler.count('pairs skipped', skipped)
+
+    @staticmethod
+    def getConfidenceOrder(confidences):
+        """Order of the detections by decreasing confidence. Ties keep their original order
+        (stable sort), so detections with the same confidence are matched in the order they were
+        added to the BoundingBoxes, as in the original list-based implementation.
+        The stable NumPy sort is a timsort: runs of detections already sorted by decreasing
+        confidence (e.g. files or shards written sorted) are detected and merged, so k sorted
+        shards are merged in O(N log k) instead of sorted from scratch, and already sorted
+        detections only cost a linear check.
+        Args:
+            confidences: sequence with the confidence of each detection.
+        Returns:
+            Array with the positions of the detections in decreasing order of confidence.
+        """
+        confidences = np.asarray(confidences, dtype=np.float64).reshape(-1)
+        if len(confidences) < 2 or (confidences[1:] <= confidences[:-1]).all():
+            return np.arange(len(confidences))
+        return np.argsort(-confidences, kind='stable')
+
+    @staticmethod
+    def mergeSortedShards(shards):
+        """Merge shards of confidences, each sorted by decreasing confidence, into a single
+        order (see getConfidenceOrder): ties are broken by shard, then by position in the shard.
+        Args:
+            shards: list of arrays of confidences sorted by decreasing confidence.
+        Returns:
+            Array with the positions in the concatenation of the shards of the detections in
+            decreasing order of confidence.
+        """
+        if len(shards) == 0:
+            return np.empty(0, dtype=np.intp)
+        return Evaluator.getConfidenceOrder(np.concatenate(shards))
+
+    @staticmethod
+    def _sortDetections(classData, order=None):
+        """Return the images and boxes of the detections of an index entry sorted by decreasing
+        confidence (see getConfidenceOrder), or in the given order."""
+        if order is None:
+            order = Evaluator.getConfidenceOrder(classData['confidences'])
+        if isinstance(classData['confidences'], np.ndarray):
+            images = classData['images'][order]
+            boxes = classData['boxes'][order]
+        else:
+            images = [classData['images'][d] for d in order.tolist()]
+            boxes = [classData['boxes'][d] for d in order.tolist()]
+        return images, boxes
+
+    @staticmethod
+    def _matchClass(images, boxes, gts, IOUThreshold, engine):
+        """Match detections to ground truths with the given MatchingEngine.
+        Returns:
+            TP, FP: arrays flagging each detection as True Positive or False Positive;
+            pairs: number of pairs of a detection and a ground truth of the same image whose IOU
+            was computed;
+            skipped: number of such pairs whose IOU was not computed, because their boxes do not
+            intersect (Scalar) or the SpatialIndex discarded them.
+        """
+        if engine == MatchingEngine.Vectorized:
+            return Evaluator._matchDetections(images, boxes, gts, IOUThreshold)
+        if engine == MatchingEngine.SpatialIndex:
+            return Evaluator._matchDetectionsSpatial(images, boxes, gts, IOUThreshold)
+        return Evaluator._matchDetectionsScalar(images, boxes, gts, IOUThreshold)
+
+    @staticmethod
+    def _getClassMetrics(c, TP, FP, npos, method):
+        """Compute precision, recall and average precision of class c from its TP and FP flags
+        (sorted by decreasing confidence)."""
+        # compute precision, recall and average precision
+        acc_FP = np.cumsum(FP)
+        acc_TP = np.cumsum(TP)
+        rec = acc_TP / npos
+        prec = np.divide(acc_TP, (acc_FP + acc_TP))
+        # Depending on the method, call the right implementation
+        if method == MethodAveragePrecision.EveryPointInterpolation:
+            [ap, mpre, mrec, ii] = Evaluator.CalculateAveragePrecision(rec, prec)
+        else:
+            [ap, mpre, mrec, _] = Evaluator.ElevenPointInterpolatedAP(rec, prec)
+        # add class result in the dictionary to be returned
+        return {
+            'class': c,
+            'precision': prec,
+            'recall': rec,
+            'AP': ap,
+            'interpolated precision': mpre,
+            'interpolated recall': mrec,
+            'total positives': npos,
+            'total TP': np.sum(TP),
+            'total FP': np.sum(FP)
+        }
+
+    @staticmethod
+    def _matchDetectionsScalar(images, boxes, gts, IOUThreshold):
+        """Match detections to the ground truths computing the IOU of each pair as Evaluator.iou
+        does. Arguments and return values are the same as Evaluator._matchDetections.
+        """
+        TP = np.zeros(len(images))
+        FP = np.zeros(len(images))
+        pairs = 0
+        skipped = 0
+        # create dictionary with amount of gts for each image
+        det = {key: np.zeros(len(gts[key])) for key in gts}
+
+        # Loop through detections
+        for d in range(len(images)):
+            # Find ground truth image
+            gt = gts[images[d]] if images[d] in gts else []
+            iouMax = sys.float_info.min
+            for j in range(len(gt)):
+                # if boxes dont intersect, their IOU (0) is not computed
+                if Evaluator._boxesIntersect(boxes[d], gt[j]) is False:
+                    skipped += 1
+                    continue
+                pairs += 1
+                interArea = Evaluator._getIntersectionArea(boxes[d], gt[j])
+                iou = interArea / Evaluator._getUnionAreas(boxes[d], gt[j], interArea=interArea)
+                if iou > iouMax:
+                    iouMax = iou
+                    jmax = j
+            # Assign detection as true positive/don't care/false positive
+            if iouMax >= IOUThreshold:
+                if det[images[d]][jmax] == 0:
+                    TP[d] = 1  # count as true positive
+                    det[images[d]][jmax] = 1  # flag as already 'seen'
+                else:
+                    FP[d] = 1  # count as false positive
+            # - A detected "cat" is overlaped with a GT "cat" with IOU >= IOUThreshold.
+            else:
+                FP[d] = 1  # count as false positive
+        return TP, FP, pairs, skipped
+
+    @staticmethod
+    def _matchDetections(images, boxes, gts, IOUThreshold):
+        """Match detections to the ground truths using one IOU matrix per image.
+        Args:
+            images: image name of each detection, sorted by decreasing confidence;
+            boxes: coordinates (XYX2Y2) of each detection, in the same order as images;
+            gts: dictionary mapping each image name to the coordinates (XYX2Y2) of its ground
+            truths;
+            IOUThreshold: IOU threshold indicating which detections will be considered TP or FP.
+        Returns:
+            TP, FP, pairs, skipped: see Evaluator._matchClass.
+        """
+        ious, gtKeys, pairs, skipped = Evaluator._getBestMatches(images, boxes, gts)
+        return Evaluator._assignMatches(ious, gtKeys, IOUThreshold) + (pairs, skipped)
+
+    @staticmethod
+    def _matchDetectionsSpatial(images, boxes, gts, IOUThreshold):
+        """Same as Evaluator._matchDetections, but only compares each detection with the ground
+        truths that may reach IOUThreshold (see SpatialIndex)."""
+        ious, gtKeys, pairs, skipped = Evaluator._getBestMatches(images, boxes, gts, IOUThreshold)
+        return Evaluator._assignMatches(ious, gtKeys, IOUThreshold) + (pairs, skipped)
+
+    @staticmethod
+    def _getBestMatches(images, boxes, gts, minIOU=None):
+        """For each detection, find the ground truth of the same image with the highest IOU.
+        Ties are broken by the first ground truth, as in the scalar engine.
+        Args:
+            images, boxes, gts: see Evaluator._matchDetections;
+            minIOU (optional): if informed, images with many detection/ground truth pairs use a
+            SpatialIndex to skip the ground truths that cannot reach minIOU. The best match of
+            the detections whose highest IOU reaches minIOU does not change; the other
+            detections may get a lower IOU (or no ground truth), which does not change whether
+            they reach minIOU.
+        Returns:
+            ious: highest IOU of each detection (0 if the image has no ground truths);
+            gtKeys: index identifying the matched ground truth among all ground truths in gts
+            (-1 if the detection does not overlap any ground truth);
+            pairs, skipped: number of pairs of a detection and a ground truth of the same image
+            whose IOU was computed, and whose IOU was skipped by the SpatialIndex.
+        """
+        ious = np.zeros(len(images))
+        gtKeys = np.full(len(images), -1, dtype=np.int64)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        # Group detections by image keeping their confidence order
+        if isinstance(images, np.ndarray):
+            order = np.argsort(images, kind='stable')
+            uniqueImages, starts = np.unique(images[order], return_index=True)
+            detsPerImage = dict(zip(uniqueImages.tolist(), np.split(order, starts[1:])))
+        else:
+            detsPerImage = {}
+            for d, image in enumerate(images):
+                detsPerImage.setdefault(image, []).append(d)
+        offset = 0
+        pairs = 0
+        skipped = 0
+        for image, gtBoxes in gts.items():
+            idx = detsPerImage.get(image)
+            if idx is not None and len(gtBoxes) > 0:
+                best = None
+                if minIOU is not None and len(idx) * len(gtBoxes) >= SpatialIndex.minPairs and \
+                        SpatialIndex.isIndexable(gtBoxes) and SpatialIndex.isIndexable(boxes[idx]):
+                    best = Evaluator._getBestCandidates(boxes[idx], gtBoxes, minIOU)
+                if best is not None:
+                    iouMax, jmax, candidates = best
+                    pairs += candidates
+                    skipped += len(idx) * len(gtBoxes) - candidates
+                else:
+                    iouMatrix = Evaluator._getIOUMatrix(boxes[idx], gtBoxes)
+                    jmax = np.argmax(iouMatrix, axis=1)
+                    iouMax = iouMatrix[np.arange(len(idx)), jmax]
+                    pairs += iouMatrix.size
+                # the scalar engine only accepts IOUs above sys.float_info.min
+                overlaps = iouMax > sys.float_info.min
+                ious[idx] = np.where(overlaps, iouMax, 0)
+                gtKeys[idx] = np.where(overlaps, jmax + offset, -1)
+            offset += len(gtBoxes)
+        return ious, gtKeys, pairs, skipped
+
+    @staticmethod
+    def _getBestCandidates(detBoxes, gtBoxes, minIOU):
+        """Highest IOU of each detection among the ground truths returned by a SpatialIndex
+        query, the position of that ground truth (first one in case of ties) and the number of
+        candidate pairs. Detections without candidates get IOU 0. Returns None if the grid does
+        not skip enough pairs to be faster than the full IOU matrix."""
+        gtBoxes = np.asarray(gtBoxes, dtype=np.float64).reshape(-1, 4)
+        index = SpatialIndex(gtBoxes)
+        # Boxes usually cover around 4 cells of the grid: with few cells, most pairs are
+        # candidates
+        if index.getCellCount() * SpatialIndex.maxCandidateFraction < 4:
+            return None
+        pairs = index.query(detBoxes, minIOU,
+                            SpatialIndex.maxCandidateFraction * len(detBoxes) * len(gtBoxes))
+        if pairs is None:
+            return None
+        queries, candidates = pairs
+        pairIOUs = Evaluator._getPairIOUs(detBoxes[queries], gtBoxes[candidates])
+        # Sort the pairs by detection, decreasing IOU and ground truth, as np.argmax does
+        order = np.lexsort((candidates, -pairIOUs, queries))
+        dets, first = np.unique(queries[order], return_index=True)
+        iouMax = np.zeros(len(detBoxes))
+        jmax = np.zeros(len(detBoxes), dtype=np.int64)
+        iouMax[dets] = pairIOUs[order[first]]
+        jmax[dets] = candidates[order[first]]
+        return iouMax, jmax, len(queries)
+
+    @staticmethod
+    def _assignMatches(ious, gtKeys, IOUThreshold):
+        """Greedy assignment of detections (sorted by decreasing confidence) to ground truths.
+        A detection is a True Positive if its best IOU reaches the threshold and no detection
+        with higher confidence was already assigned to the same ground truth.
+        Returns:
+            TP, FP: arrays flagging each detection as True Positive or False Positive.
+        """
+        TP = np.zeros(len(ious))
+        valid = np.flatnonzero((gtKeys >= 0) & (ious >= IOUThreshold))
+        # only the first (most confident) detection of each ground truth is a true positive
+        _, first = np.unique(gtKeys[valid], return_index=True)
+        TP[valid[first]] = 1
+        FP = 1 - TP
+        return TP, FP
+
     def PlotPrecisionRecallCurve(self,
                                  boundingBoxes,
                                  IOUThreshold=0.5,
@@ -155,7 +1063,10 @@ class Evaluator:
                                  showAP=False,
                                  showInterpolatedPrecision=False,
                                  savePath=None,
-                                 showGraphic=True):
+                                 showGraphic=True,
+                                 workers=1,
+                                 executor=ExecutorType.Process,
+                                 maxPoints=10000):
         """PlotPrecisionRecallCurve
         Plot the Precision x Recall curve for a given class.
         Args:
@@ -173,7 +1084,15 @@ class Evaluator:
              precision (default = False);
             savePath (optional): if informed, the plot will be saved as an image in this path
             (ex: /home/mywork/ap.png) (default = None);
-            showGraphic (optional): if True, the plot will be shown (default = True)
+            showGraphic (optional): if True, the plot will be shown (default = True). If False,
+            the plots are rendered with the Agg backend without pyplot (see Plotting), by the
+            pool of workers if workers > 1, and matplotlib is not even imported if savePath is
+            not informed;
+            workers (optional): number of workers evaluating the classes (and rendering the
+            plots, if showGraphic is False) in parallel (default = 1);
+            executor (optional): ExecutorType of the pool of workers (default = Process);
+            maxPoints (optional): curves with more points are decimated to this number of
+            vertices before being drawn (default = 10000; None draws all points).
         Returns:
             A list of dictionaries. Each dictionary contains information and metrics of each class.
             The keys of each dictionary are:
@@ -187,181 +1106,105 @@ class Evaluator:
             dict['total TP']: total number of True Positive detections;
             dict['total FP']: total number of False Negative detections;
         """
-        results = self.GetPascalVOCMetrics(boundingBoxes, IOUThreshold, method)
+        results = self.GetPascalVOCMetrics(boundingBoxes,
+                                           IOUThreshold,
+                                           method,
+                                           workers=workers,
+                                           executor=executor)
+        return self.PlotResults(results, method, showAP, showInterpolatedPrecision, savePath,
+                                showGraphic, workers, executor, maxPoints)
+
+    def PlotResults(self,
+                    results,
+                    method=MethodAveragePrecision.EveryPointInterpolation,
+                    showAP=False,
+                    showInterpolatedPrecision=False,
+                    savePath=None,
+                    showGraphic=True,
+                    workers=1,
+                    executor=ExecutorType.Process,
+                    maxPoints=10000):
+        """Plot the Precision x Recall curves of metrics already calculated, as
+        PlotPrecisionRecallCurve does.
+        Args:
+            results: list of dictionaries returned by GetPascalVOCMetrics (or by
+            StreamingEvaluator.GetPascalVOCMetrics);
+            method, showAP, showInterpolatedPrecision, savePath, showGraphic, workers, executor,
+            maxPoints (optional): see PlotPrecisionRecallCurve.
+        Returns:
+            results.
+        """
+        if showGraphic is not True:
+            if savePath is not None:
+                # Plotting imports matplotlib, so it is only imported when plots are rendered
+                from Plotting import renderPrecisionRecallCurves
+                with self._profiler.timer('plot'):
+                    renderPrecisionRecallCurves(results, savePath, method, showAP,
+                                                showInterpolatedPrecision, maxPoints, workers,
+                                                executor)
+            return results
+        import matplotlib.pyplot as plt
+        from OutputManager import atomicPath
+        from Plotting import drawPrecisionRecallCurve
         result = None
         # Each resut represents a class
         for result in results:
             if result is None:
                 raise IOError('Error: Class %d could not be found.' % classId)
-
+            start = time.perf_counter()
             classId = result['class']
-            precision = result['precision']
-            recall = result['recall']
-            average_precision = result['AP']
-            mpre = result['interpolated precision']
-            mrec = result['interpolated recall']
-            npos = result['total positives']
-            total_tp = result['total TP']
-            total_fp = result['total FP']
-
             plt.close()
-            if showInterpolatedPrecision:
-                if method == MethodAveragePrecision.EveryPointInterpolation:
-                    plt.plot(mrec, mpre, '--r', label='Interpolated precision (every point)')
-                elif method == MethodAveragePrecision.ElevenPointInterpolation:
-                    # Uncomment the line below if you want to plot the area
-                    # plt.plot(mrec, mpre, 'or', label='11-point interpolated precision')
-                    # Remove duplicates, getting only the highest precision of each recall value
-                    nrec = []
-                    nprec = []
-                    for idx in range(len(mrec)):
-                        r = mrec[idx]
-                        if r not in nrec:
-                            idxEq = np.argwhere(mrec == r)
-                            nrec.append(r)
-                            nprec.append(max([mpre[int(id)] for id in idxEq]))
-                    plt.plot(nrec, nprec, 'or', label='11-point interpolated precision')
-            plt.plot(recall, precision, label='Precision')
-            plt.xlabel('recall')
-            plt.ylabel('precision')
-            if showAP:
-                ap_str = "{0:.2f}%".format(average_precision * 100)
-                # ap_str = "{0:.4f}%".format(average_precision * 100)
-                plt.title('Precision x Recall curve \nClass: %s, AP: %s' % (str(classId), ap_str))
-            else:
-                plt.title('Precision x Recall curve \nClass: %s' % str(classId))
-            plt.legend(shadow=True)
-            plt.grid()
-            ############################################################
-            # Uncomment the following block to create plot with points #
-            ############################################################
-            # plt.plot(recall, precision, 'bo')
-            # labels = ['R', 'Y', 'J', 'A', 'U', 'C', 'M', 'F', 'D', 'B', 'H', 'P', 'E', 'X', 'N', 'T',
-            # 'K', 'Q', 'V', 'I', 'L', 'S', 'G', 'O']
-            # dicPosition = {}
-            # dicPosition['left_zero'] = (-30,0)
-            # dicPosition['left_zero_slight'] = (-30,-10)
-            # dicPosition['right_zero'] = (30,0)
-            # dicPosition['left_up'] = (-30,20)
-            # dicPosition['left_down'] = (-30,-25)
-            # dicPosition['right_up'] = (20,20)
-            # dicPosition['right_down'] = (20,-20)
-            # dicPosition['up_zero'] = (0,30)
-            # dicPosition['up_right'] = (0,30)
-            # dicPosition['left_zero_long'] = (-60,-2)
-            # dicPosition['down_zero'] = (-2,-30)
-            # vecPositions = [
-            #     dicPosition['left_down'],
-            #     dicPosition['left_zero'],
-            #     dicPosition['right_zero'],
-            #     dicPosition['right_zero'],  #'R', 'Y', 'J', 'A',
-            #     dicPosition['left_up'],
-            #     dicPosition['left_up'],
-            #     dicPosition['right_up'],
-            #     dicPosition['left_up'],  # 'U', 'C', 'M', 'F',
-            #     dicPosition['left_zero'],
-            #     dicPosition['right_up'],
-            #     dicPosition['right_down'],
-            #     dicPosition['down_zero'],  #'D', 'B', 'H', 'P'
-            #     dicPosition['left_up'],
-            #     dicPosition['up_zero'],
-            #     dicPosition['right_up'],
-            #     dicPosition['left_up'],  # 'E', 'X', 'N', 'T',
-            #     dicPosition['left_zero'],
-            #     dicPosition['right_zero'],
-            #     dicPosition['left_zero_long'],
-            #     dicPosition['left_zero_slight'],  # 'K', 'Q', 'V', 'I',
-            #     dicPosition['right_down'],
-            #     dicPosition['left_down'],
-            #     dicPosition['right_up'],
-            #     dicPosition['down_zero']
-            # ]  # 'L', 'S', 'G', 'O'
-            # for idx in range(len(labels)):
-            #     box = dict(boxstyle='round,pad=.5',facecolor='yellow',alpha=0.5)
-            #     plt.annotate(labels[idx],
-            #                 xy=(recall[idx],precision[idx]), xycoords='data',
-            #                 xytext=vecPositions[idx], textcoords='offset points',
-            #                 arrowprops=dict(arrowstyle="->", connectionstyle="arc3"),
-            #                 bbox=box)
+            drawPrecisionRecallCurve(plt.gca(), result, method, showAP, showInterpolatedPrecision,
+                                     maxPoints)
             if savePath is not None:
-                plt.savefig(os.path.join(savePath, str(classId) + '.png'))
-            if showGraphic is True:
-                plt.show()
-                # plt.waitforbuttonpress()
-                plt.pause(0.05)
+                with atomicPath(os.path.join(savePath, str(classId) + '.png')) as tempPath:
+                    plt.savefig(tempPath)
+            self._profiler.addTime('plot', time.perf_counter() - start, classId)
+            plt.show()
+            # plt.waitforbuttonpress()
+            plt.pause(0.05)
         return results
 
     @staticmethod
     def CalculateAveragePrecision(rec, prec):
-        mrec = []
-        mrec.append(0)
-        [mrec.append(e) for e in rec]
-        mrec.append(1)
-        mpre = []
-        mpre.append(0)
-        [mpre.append(e) for e in prec]
-        mpre.append(0)
-        for i in range(len(mpre) - 1, 0, -1):
-            mpre[i - 1] = max(mpre[i - 1], mpre[i])
-        ii = []
-        for i in range(len(mrec) - 1):
-            if mrec[1+i] != mrec[i]:
-                ii.append(i + 1)
-        ap = 0
-        for i in ii:
-            ap = ap + np.sum((mrec[i] - mrec[i - 1]) * mpre[i])
+        mrec = np.concatenate(([0], np.asarray(rec, dtype=np.float64), [1]))
+        mpre = np.concatenate(([0], np.asarray(prec, dtype=np.float64), [0]))
+        # precision envelope: maximum precision at each recall or above
+        mpre = np.maximum.accumulate(mpre[::-1])[::-1]
+        # indexes where the recall changes
+        ii = np.flatnonzero(mrec[1:] != mrec[:-1]) + 1
+        # cumsum adds the areas sequentially, in the same order as a loop over ii would
+        ap = np.cumsum((mrec[ii] - mrec[ii - 1]) * mpre[ii])[-1]
         # return [ap, mpre[1:len(mpre)-1], mrec[1:len(mpre)-1], ii]
-        return [ap, mpre[0:len(mpre) - 1], mrec[0:len(mpre) - 1], ii]
+        return [ap, mpre[:-1].tolist(), mrec[:-1].tolist(), ii.tolist()]
 
     @staticmethod
     # 11-point interpolated average precision
     def ElevenPointInterpolatedAP(rec, prec):
-        # def CalculateAveragePrecision2(rec, prec):
-        mrec = []
-        # mrec.append(0)
-        [mrec.append(e) for e in rec]
-        # mrec.append(1)
-        mpre = []
-        # mpre.append(0)
-        [mpre.append(e) for e in prec]
-        # mpre.append(0)
-        recallValues = np.linspace(0, 1, 11)
-        recallValues = list(recallValues[::-1])
-        rhoInterp = []
-        recallValid = []
-        # For each recallValues (0, 0.1, 0.2, ... , 1)
-        for r in recallValues:
-            # Obtain all recall values higher or equal than r
-            argGreaterRecalls = np.argwhere(mrec[:] >= r)
-            pmax = 0
+        mrec = np.asarray(rec, dtype=np.float64).reshape(-1)
+        mpre = np.asarray(prec, dtype=np.float64).reshape(-1)
+        # recallValues = (1, 0.9, 0.8, ... , 0)
+        recallValues = np.linspace(0, 1, 11)[::-1]
+        rhoInterp = np.zeros(len(recallValues))
+        if len(mrec) > 0:
+            # For each recallValues, the first position whose recall is higher or equal than it
+            greaterRecalls = mrec[None, :] >= recallValues[:, None]
+            first = greaterRecalls.argmax(axis=1)
+            # maximum precision from each position to the end
+            suffixMax = np.maximum.accumulate(mpre[::-1])[::-1]
             # If there are recalls above r
-            if argGreaterRecalls.size != 0:
-                pmax = max(mpre[argGreaterRecalls.min():])
-            recallValid.append(r)
-            rhoInterp.append(pmax)
+            rhoInterp = np.where(greaterRecalls.any(axis=1), suffixMax[first], 0)
         # By definition AP = sum(max(precision whose recall is above r))/11
-        ap = sum(rhoInterp) / 11
-        # Generating values for the plot
-        rvals = []
-        rvals.append(recallValid[0])
-        [rvals.append(e) for e in recallValid]
-        rvals.append(0)
-        pvals = []
-        pvals.append(0)
-        [pvals.append(e) for e in rhoInterp]
-        pvals.append(0)
-        # rhoInterp = rhoInterp[::-1]
-        cc = []
-        for i in range(len(rvals)):
-            p = (rvals[i], pvals[i - 1])
-            if p not in cc:
-                cc.append(p)
-            p = (rvals[i], pvals[i])
-            if p not in cc:
-                cc.append(p)
-        recallValues = [i[0] for i in cc]
-        rhoInterp = [i[1] for i in cc]
-        return [ap, rhoInterp, recallValues, None]
+        ap = sum(rhoInterp.tolist()) / 11
+        # Generating values for the plot: pairs (rvals[i], pvals[i - 1]) and (rvals[i], pvals[i])
+        rvals = np.concatenate(([recallValues[0]], recallValues, [0]))
+        pvals = np.concatenate(([0], rhoInterp, [0]))
+        cc = np.stack((np.repeat(rvals, 2), np.stack((np.roll(pvals, 1), pvals), axis=1).ravel()),
+                      axis=1)
+        # Remove duplicated points, keeping the first occurrence of each one
+        _, firstOccurrences = np.unique(cc, axis=0, return_index=True)
+        cc = cc[np.sort(firstOccurrences)]
+        return [ap, cc[:, 1].tolist(), cc[:, 0].tolist(), None]
 
     # For each detections, calculate IOU with reference
     @staticmethod
@@ -393,6 +1236,38 @@ class Evaluator:
         assert iou >= 0
         return iou
 
+    # boxesA = [(Ax1,Ay1,Ax2,Ay2), ...]
+    # boxesB = [(Bx1,By1,Bx2,By2), ...]
+    @staticmethod
+    def _getIOUMatrix(boxesA, boxesB):
+        """IOU between each box of boxesA (rows) and each box of boxesB (columns), following the
+        same conventions (+1 pixel areas, touching boxes intersect) as Evaluator.iou."""
+        boxesA = np.asarray(boxesA, dtype=np.float64).reshape(-1, 4)
+        boxesB = np.asarray(boxesB, dtype=np.float64).reshape(-1, 4)
+        return Evaluator._getPairIOUs(boxesA[:, None, :], boxesB[None, :, :])
+
+    @staticmethod
+    def _getPairIOUs(boxesA, boxesB):
+        """IOU between boxesA[i] and boxesB[i] for arrays of boxes with shapes (..., 4) that can be
+        broadcast together, with the same conventions as Evaluator.iou."""
+        ax1, ay1, ax2, ay2 = [boxesA[..., i] for i in range(4)]
+        bx1, by1, bx2, by2 = [boxesB[..., i] for i in range(4)]
+        intersect = Evaluator._getPairIntersects(boxesA, boxesB)
+        interArea = (np.minimum(ax2, bx2) - np.maximum(ax1, bx1) + 1) * \
+            (np.minimum(ay2, by2) - np.maximum(ay1, by1) + 1)
+        area_A = (ax2 - ax1 + 1) * (ay2 - ay1 + 1)
+        area_B = (bx2 - bx1 + 1) * (by2 - by1 + 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            iou = interArea / (area_A + area_B - interArea)
+        return np.where(intersect, iou, 0)
+
+    @staticmethod
+    def _getPairIntersects(boxesA, boxesB):
+        """Evaluator._boxesIntersect between boxesA[i] and boxesB[i] (see _getPairIOUs)."""
+        ax1, ay1, ax2, ay2 = [boxesA[..., i] for i in range(4)]
+        bx1, by1, bx2, by2 = [boxesB[..., i] for i in range(4)]
+        return ~((ax1 > bx2) | (bx1 > ax2) | (ay2 < by1) | (ay1 > by2))
+
     # boxA = (Ax1,Ay1,Ax2,Ay2)
     # boxB = (Bx1,By1,Bx2,By2)
     @staticmethod
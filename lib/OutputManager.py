@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+from utils import *
+
+# File of the save folder listing the files written by the previous run
+MANIFEST_FILE = '.manifest.json'
+MANIFEST_VERSION = 1
+
+
+@contextmanager
+def atomicPath(filePath):
+    """Give a temporary path next to filePath (with the same extension, so writers that choose
+    the format from it still work) and rename it to filePath when the block ends. Readers never
+    see a partial file, and filePath is left unchanged if the block raises an exception."""
+    base, extension = os.path.splitext(filePath)
+    tempPath = '%s.%d.tmp%s' % (base, os.getpid(), extension)
+    try:
+        yield tempPath
+        os.replace(tempPath, filePath)
+    finally:
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+
+
+def _updateDigest(h, value):
+    if isinstance(value, dict):
+        h.update(b'{')
+        for k in sorted(value, key=str):
+            _updateDigest(h, k)
+            _updateDigest(h, value[k])
+        h.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        h.update(b'[')
+        for v in value:
+            _updateDigest(h, v)
+        h.update(b']')
+    elif isinstance(value, np.ndarray):
+        h.update(('%s%s' % (value.dtype.str, value.shape)).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, np.generic):
+        _updateDigest(h, value.item())
+    else:
+        h.update(('%s:%r;' % (type(value).__name__, value)).encode())
+
+
+def getDigest(*values):
+    """Hexadecimal digest of values, which may be dictionaries, lists, NumPy arrays and scalars
+    (e.g. the results of Evaluator.GetPascalVOCMetrics and the options of an output file)."""
+    h = hashlib.blake2b(digest_size=16)
+    _updateDigest(h, values)
+    return h.hexdigest()
+
+
+class OutputManager:
+    """Files with the results of an evaluation, written into a save folder.
+
+    Each file is written into a temporary file and renamed (see atomicPath), so an interrupted
+    run never leaves a partial file. The folder keeps a manifest (MANIFEST_FILE) with the files
+    written and a digest of the inputs of each one. In OutputMode.Resume, a file is not written
+    again if the previous run wrote it from the same inputs and it was not modified since. In
+    both modes, the files of the previous run that are not written by the current one (e.g. the
+    plot of a class that no longer exists) are removed by close(). Other files of the folder are
+    never touched.
+    """
+
+    def __init__(self, savePath, mode=OutputMode.Overwrite):
+        """Constructor.
+        Args:
+            savePath: folder where the files are written (created if it does not exist);
+            mode (optional): OutputMode.Overwrite writes all files, OutputMode.Resume only the
+            files whose inputs changed (default = Overwrite).
+        """
+        self.savePath = savePath
+        self.mode = mode
+        self.written = 0
+        self.kept = 0
+        self._previous = {}
+        self._files = {}
+        os.makedirs(savePath, exist_ok=True)
+        try:
+            with open(self.getPath(MANIFEST_FILE), 'r') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION:
+                # Names must be relative to the save folder (see _isInside)
+                self._previous = {
+                    name: entry
+                    for name, entry in manifest['files'].items() if not os.path.isabs(name)
+                }
+        except (OSError, ValueError, KeyError, AttributeError):
+            # Without a valid manifest, all files are written again
+            self._previous = {}
+
+    def getPath(self, name):
+        """Path of the file name (relative to the save folder)."""
+        return os.path.join(self.savePath, name)
+
+    def _isInside(self, name):
+        """True if the file name is inside the save folder, once symbolic links and '..' are
+        resolved. A stale or edited manifest must never make close() remove other files."""
+        savePath = os.path.realpath(self.savePath)
+        return os.path.commonpath([savePath, os.path.realpath(self.getPath(name))]) == savePath
+
+    def _getEntry(self, name, digest):
+        stat = os.stat(self.getPath(name))
+        return {'digest': digest, 'size': stat.st_size, 'modified': stat.st_mtime_ns}
+
+    def isUpToDate(self, name, digest):
+        """True if the file name can be kept: in OutputMode.Resume, if the previous run wrote it
+        from inputs with the same digest and it was not modified (or replaced) since."""
+        previous = self._previous.get(name)
+        if self.mode != OutputMode.Resume or previous is None or digest is None:
+            return False
+        try:
+            return self._getEntry(name, digest) == previous
+        except OSError:
+            return False
+
+    def addFile(self, name, digest=None):
+        """Add to the manifest a file written into the save folder by other means (e.g. the plots
+        rendered by a pool of workers)."""
+        self._files[name] = self._getEntry(name, digest)
+        self.written += 1
+
+    def keep(self, name):
+        """Add to the manifest an up-to-date file (see isUpToDate) kept without writing it."""
+        self._files[name] = self._previous[name]
+        self.kept += 1
+
+    def write(self, name, writer, digest=None):
+        """Write the file name with writer(path), where path is a temporary file renamed to name
+        once writer returns. The file is kept (and writer is not called) if it is up to date (see
+        isUpToDate).
+        Args:
+            name: path of the file, relative to the save folder;
+            writer: function that writes the file into the path it receives;
+            digest (optional): digest of the inputs of the file (see getDigest). Files without
+            digest are always written.
+        Returns:
+            True if the file was written, False if it was kept.
+        """
+        if self.isUpToDate(name, digest):
+            self.keep(name)
+            return False
+        path = self.getPath(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomicPath(path) as tempPath:
+            writer(tempPath)
+        self.addFile(name, digest)
+        return True
+
+    def close(self):
+        """Remove the files of the previous run that were not written (or kept) by this one, and
+        the subfolders they leave empty, and save the manifest."""
+        for name in self._previous:
+            if name in self._files or not self._isInside(name):
+                continue
+            # Without '..', the folders removed below are all inside the save folder
+            name = os.path.normpath(name)
+            if os.path.isfile(self.getPath(name)):
+                os.remove(self.getPath(name))
+                folder = os.path.dirname(name)
+                while folder and not os.listdir(self.getPath(folder)):
+                    os.rmdir(self.getPath(folder))
+                    folder = os.path.dirname(folder)
+        with atomicPath(self.getPath(MANIFEST_FILE)) as tempPath:
+            with open(tempPath, 'w') as f:
+                json.dump({'version': MANIFEST_VERSION, 'files': self._files}, f, indent=1)
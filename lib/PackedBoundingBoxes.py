@@ -0,0 +1,226 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from BoundingBoxesLoader import *
+from ColumnarBoundingBoxes import *
+from utils import *
+
+# Packed file layout (little-endian):
+#   header (HEADER_DTYPE);
+#   records (RECORD_DTYPE), one per bounding box, starting at header['recordsOffset']: first the
+#   header['groundTruths'] ground truths, then the detections, each in the order they were added;
+#   image names table, then class names table, starting at header['stringsOffset']. Each table
+#   is the number of strings (uint64), the offsets of the strings (uint64, number + 1 values)
+#   and the UTF-8 bytes of all strings.
+MAGIC = b'ODMPACK\0'
+VERSION = 2
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u4'), ('reserved', '<u4'),
+                         ('records', '<u8'), ('groundTruths', '<u8'), ('recordsOffset', '<u8'),
+                         ('stringsOffset', '<u8')])
+RECORD_DTYPE = np.dtype([('coordinates', '<f8', (4, )), ('confidence', '<f8'),
+                         ('image', '<i4'), ('class', '<i4'), ('type', 'i1')],
+                        align=True)
+
+
+def isPackedFile(path):
+    """True if path is a file starting with the magic number of the packed format."""
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _encodeStrings(strings):
+    data = [str(s).encode('utf-8') for s in strings]
+    offsets = np.zeros(len(data) + 1, dtype='<u8')
+    offsets[1:] = np.cumsum([len(d) for d in data])
+    return np.array([len(data)], dtype='<u8').tobytes() + offsets.tobytes() + b''.join(data)
+
+
+def _decodeStrings(buffer, position):
+    """Decode a string table starting at position. Returns the strings and the position after
+    the table."""
+    count = int(np.frombuffer(buffer, dtype='<u8', count=1, offset=position)[0])
+    position += 8
+    offsets = np.frombuffer(buffer, dtype='<u8', count=count + 1, offset=position).tolist()
+    position += 8 * (count + 1)
+    data = bytes(buffer[position:position + offsets[-1]])
+    strings = [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(count)]
+    return strings, position + offsets[-1]
+
+
+def writePackedFile(path, boundingboxes):
+    """Write the bounding boxes of a ColumnarBoundingBoxes into a packed file.
+    The file is written next to path and then renamed, so readers never see a partial file.
+    Class ids are saved as strings. Ground truths are written before detections, so each type
+    is read as a contiguous range of records (see readPackedFile).
+    Args:
+        path: path of the packed file;
+        boundingboxes: ColumnarBoundingBoxes with the bounding boxes.
+    Returns:
+        The number of bounding boxes written.
+    """
+    columns = boundingboxes.getColumns()
+    n = len(columns['class ids'])
+    # Stable: the boxes of each type keep their order
+    order = np.argsort(columns['bb types'] != BBType.GroundTruth.value, kind='stable')
+    records = np.zeros(n, dtype=RECORD_DTYPE)
+    records['coordinates'] = columns['coordinates'][order]
+    records['confidence'] = columns['confidences'][order]
+    records['image'] = columns['image ids'][order]
+    records['class'] = columns['class ids'][order]
+    records['type'] = columns['bb types'][order]
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'] = MAGIC
+    header['version'] = VERSION
+    header['records'] = n
+    header['groundTruths'] = np.count_nonzero(records['type'] == BBType.GroundTruth.value)
+    # Records are aligned to 8 bytes so their fields can be read in place
+    header['recordsOffset'] = -(-HEADER_DTYPE.itemsize // 8) * 8
+    header['stringsOffset'] = header['recordsOffset'] + records.nbytes
+    tempPath = path + '.tmp'
+    with open(tempPath, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(b'\0' * (int(header['recordsOffset'][0]) - HEADER_DTYPE.itemsize))
+        f.write(records.tobytes())
+        f.write(_encodeStrings(columns['image names']))
+        f.write(_encodeStrings(columns['class names']))
+    os.replace(tempPath, path)
+    return n
+
+
+def readPackedFile(path, bbType=None):
+    """Read a packed file into a ColumnarBoundingBoxes. The file is memory-mapped and the
+    columns of the ColumnarBoundingBoxes are views of its records (no copy): the ground truths
+    and the detections are two contiguous ranges of records.
+    Args:
+        path: path of the packed file;
+        bbType (optional): if given, only the bounding boxes of this BBType are read.
+    Returns:
+        A ColumnarBoundingBoxes with the bounding boxes of the file.
+    """
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    if len(buffer) < HEADER_DTYPE.itemsize or bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise IOError('File %s is not a packed bounding boxes file' % path)
+    header = np.frombuffer(buffer, dtype=HEADER_DTYPE, count=1)[0]
+    if header['version'] != VERSION:
+        raise IOError('File %s: unsupported version %d (convert the folders again with '
+                      'lib/PackedBoundingBoxes.py)' % (path, header['version']))
+    records = np.frombuffer(buffer,
+                            dtype=RECORD_DTYPE,
+                            count=int(header['records']),
+                            offset=int(header['recordsOffset']))
+    imageNames, position = _decodeStrings(buffer, int(header['stringsOffset']))
+    classNames, _ = _decodeStrings(buffer, position)
+    if bbType == BBType.GroundTruth:
+        records = records[:int(header['groundTruths'])]
+    elif bbType == BBType.Detected:
+        records = records[int(header['groundTruths']):]
+    return ColumnarBoundingBoxes.fromArrays(classNames, imageNames, records['class'],
+                                            records['image'], records['type'],
+                                            records['coordinates'], records['confidence'])
+
+
+def loadPackedBoundingBoxes(path,
+                            isGT,
+                            allBoundingBoxes=None,
+                            minConfidence=None,
+                            maxDets=None,
+                            maxDetsPerClass=False):
+    """Read the ground truths or the detections of a packed file, as loadBoundingBoxes does for
+    a folder of txt files.
+    Args:
+        path: path of the packed file;
+        isGT: True to read the ground truths of the file, False to read its detections, None to
+        read both at once (a single range of records, so the ground truths and the detections of
+        a combined file are evaluated in place);
+        allBoundingBoxes (optional): ColumnarBoundingBoxes where the boxes are added (which
+        copies them into its columns). If not informed, the boxes are returned as views of the
+        memory-mapped file, unless some detections are discarded;
+        minConfidence, maxDets, maxDetsPerClass (optional): detections discarded (see
+        selectDetections). Ignored for ground truths.
+    Returns:
+        allBoundingBoxes: ColumnarBoundingBoxes containing the bounding boxes read;
+        stats: dictionary with the same keys as the stats of loadBoundingBoxes.
+    """
+    start = time.perf_counter()
+    bbType = {True: BBType.GroundTruth, False: BBType.Detected, None: None}[isGT]
+    boundingboxes = readPackedFile(path, bbType)
+    boxes = boundingboxes.count()
+    if not isGT:
+        detections = boundingboxes if isGT is False else readPackedFile(path, BBType.Detected)
+        columns = detections.getColumns()
+        pruned = pruneDetections(columns, minConfidence, maxDets, maxDetsPerClass)
+        if pruned is not columns:
+            boundingboxes = ColumnarBoundingBoxes.fromArrays(
+                pruned['class names'], pruned['image names'], pruned['class ids'],
+                pruned['image ids'], pruned['bb types'], pruned['coordinates'],
+                pruned['confidences'])
+            if isGT is None:
+                # The ground truths are copied once, with the detections kept
+                groundTruths = readPackedFile(path, BBType.GroundTruth)
+                groundTruths.addBoundingBoxes(boundingboxes)
+                boundingboxes = groundTruths
+    if allBoundingBoxes is None:
+        allBoundingBoxes = boundingboxes
+    else:
+        allBoundingBoxes.addBoundingBoxes(boundingboxes)
+    seconds = time.perf_counter() - start
+    stats = {
+        'files': 1,
+        'boxes': boxes,
+        'discarded': boxes - boundingboxes.count(),
+        'seconds': seconds,
+        'boxes per second': boxes / seconds if seconds > 0 else float('inf'),
+        'cached': False
+    }
+    return allBoundingBoxes, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='python lib/PackedBoundingBoxes.py',
+        description='Convert folders of txt files (one per image, as read by pascalvoc.py) into '
+        'a single packed file that pascalvoc.py accepts in place of the folders.')
+    parser.add_argument('output', help='packed file to write')
+    parser.add_argument('-gt', '--gtfolder', dest='gtFolder', help='folder with ground truths')
+    parser.add_argument('-det', '--detfolder', dest='detFolder', help='folder with detections')
+    parser.add_argument('-gtformat', dest='gtFormat', default='xywh', choices=['xywh', 'xyrb'])
+    parser.add_argument('-detformat', dest='detFormat', default='xywh', choices=['xywh', 'xyrb'])
+    parser.add_argument('-gtcoords', dest='gtCoordinates', default='abs', choices=['abs', 'rel'])
+    parser.add_argument('-detcoords', dest='detCoordinates', default='abs', choices=['abs', 'rel'])
+    parser.add_argument('-imgsize', dest='imgSize', help='\'width,height\' for relative coords')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='parsing processes')
+    args = parser.parse_args()
+    if args.gtFolder is None and args.detFolder is None:
+        parser.error('at least one of -gt and -det is required')
+    imgSize = None
+    if args.imgSize is not None:
+        imgSize = tuple(int(v) for v in args.imgSize.replace('(', '').replace(')', '').split(','))
+    formats = {'xywh': BBFormat.XYWH, 'xyrb': BBFormat.XYX2Y2}
+    coords = {'abs': CoordinatesType.Absolute, 'rel': CoordinatesType.Relative}
+    allBoundingBoxes = ColumnarBoundingBoxes()
+    for folder, isGT, bbFormat, coordType in [
+        (args.gtFolder, True, args.gtFormat, args.gtCoordinates),
+        (args.detFolder, False, args.detFormat, args.detCoordinates)
+    ]:
+        if folder is not None:
+            allBoundingBoxes, stats = loadBoundingBoxes(folder,
+                                                        isGT,
+                                                        formats[bbFormat],
+                                                        coords[coordType],
+                                                        allBoundingBoxes,
+                                                        imgSize=imgSize,
+                                                        workers=args.workers)
+            print('Read %d bounding boxes from %d files in %.2fs' %
+                  (stats['boxes'], stats['files'], stats['seconds']))
+    n = writePackedFile(args.output, allBoundingBoxes)
+    print('Wrote %d bounding boxes into %s (%d bytes)' % (n, args.output,
+                                                           os.path.getsize(args.output)))
+
+
+if __name__ == '__main__':
+    main()
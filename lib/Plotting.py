@@ -0,0 +1,159 @@
+import os
+from itertools import repeat
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from OutputManager import atomicPath
+from utils import *
+
+
+def getElevenPointMarkers(mrec, mpre):
+    """Remove duplicated recalls of the 11-point interpolated curve, getting only the highest
+    precision of each recall value."""
+    nrec = []
+    nprec = []
+    for idx in range(len(mrec)):
+        r = mrec[idx]
+        if r not in nrec:
+            idxEq = np.argwhere(mrec == r)
+            nrec.append(r)
+            nprec.append(max([mpre[int(id)] for id in idxEq]))
+    return nrec, nprec
+
+
+def drawPrecisionRecallCurve(ax,
+                             result,
+                             method=MethodAveragePrecision.EveryPointInterpolation,
+                             showAP=False,
+                             showInterpolatedPrecision=False,
+                             maxPoints=None):
+    """Draw the Precision x Recall curve of a class on a matplotlib Axes.
+    Args:
+        ax: matplotlib Axes where the curve is drawn;
+        result: dictionary with the metrics of the class (see Evaluator.GetPascalVOCMetrics);
+        method (optional): method used to calculate the average precision;
+        showAP (optional): if True, the average precision is shown in the title (default = False);
+        showInterpolatedPrecision (optional): if True, the interpolated precision is also drawn
+        (default = False);
+        maxPoints (optional): maximum number of vertices of the precision curve (see
+        decimateCurve). Default: all points are drawn.
+    """
+    classId = result['class']
+    mpre = result['interpolated precision']
+    mrec = result['interpolated recall']
+    if showInterpolatedPrecision:
+        if method == MethodAveragePrecision.EveryPointInterpolation:
+            nrec, nprec = decimateCurve(mrec, mpre, maxPoints)
+            ax.plot(nrec, nprec, '--r', label='Interpolated precision (every point)')
+        elif method == MethodAveragePrecision.ElevenPointInterpolation:
+            # Uncomment the line below if you want to plot the area
+            # ax.plot(mrec, mpre, 'or', label='11-point interpolated precision')
+            nrec, nprec = getElevenPointMarkers(np.asarray(mrec), np.asarray(mpre))
+            ax.plot(nrec, nprec, 'or', label='11-point interpolated precision')
+    recall, precision = decimateCurve(result['recall'], result['precision'], maxPoints)
+    ax.plot(recall, precision, label='Precision')
+    ax.set_xlabel('recall')
+    ax.set_ylabel('precision')
+    if showAP:
+        ap_str = "{0:.2f}%".format(result['AP'] * 100)
+        # ap_str = "{0:.4f}%".format(result['AP'] * 100)
+        ax.set_title('Precision x Recall curve \nClass: %s, AP: %s' % (str(classId), ap_str))
+    else:
+        ax.set_title('Precision x Recall curve \nClass: %s' % str(classId))
+    ax.legend(shadow=True)
+    ax.grid()
+    ############################################################
+    # Uncomment the following block to create plot with points #
+    ############################################################
+    # ax.plot(recall, precision, 'bo')
+    # labels = ['R', 'Y', 'J', 'A', 'U', 'C', 'M', 'F', 'D', 'B', 'H', 'P', 'E', 'X', 'N', 'T',
+    # 'K', 'Q', 'V', 'I', 'L', 'S', 'G', 'O']
+    # dicPosition = {}
+    # dicPosition['left_zero'] = (-30,0)
+    # dicPosition['left_zero_slight'] = (-30,-10)
+    # dicPosition['right_zero'] = (30,0)
+    # dicPosition['left_up'] = (-30,20)
+    # dicPosition['left_down'] = (-30,-25)
+    # dicPosition['right_up'] = (20,20)
+    # dicPosition['right_down'] = (20,-20)
+    # dicPosition['up_zero'] = (0,30)
+    # dicPosition['up_right'] = (0,30)
+    # dicPosition['left_zero_long'] = (-60,-2)
+    # dicPosition['down_zero'] = (-2,-30)
+    # vecPositions = [
+    #     dicPosition['left_down'],
+    #     dicPosition['left_zero'],
+    #     dicPosition['right_zero'],
+    #     dicPosition['right_zero'],  #'R', 'Y', 'J', 'A',
+    #     dicPosition['left_up'],
+    #     dicPosition['left_up'],
+    #     dicPosition['right_up'],
+    #     dicPosition['left_up'],  # 'U', 'C', 'M', 'F',
+    #     dicPosition['left_zero'],
+    #     dicPosition['right_up'],
+    #     dicPosition['right_down'],
+    #     dicPosition['down_zero'],  #'D', 'B', 'H', 'P'
+    #     dicPosition['left_up'],
+    #     dicPosition['up_zero'],
+    #     dicPosition['right_up'],
+    #     dicPosition['left_up'],  # 'E', 'X', 'N', 'T',
+    #     dicPosition['left_zero'],
+    #     dicPosition['right_zero'],
+    #     dicPosition['left_zero_long'],
+    #     dicPosition['left_zero_slight'],  # 'K', 'Q', 'V', 'I',
+    #     dicPosition['right_down'],
+    #     dicPosition['left_down'],
+    #     dicPosition['right_up'],
+    #     dicPosition['down_zero']
+    # ]  # 'L', 'S', 'G', 'O'
+    # for idx in range(len(labels)):
+    #     box = dict(boxstyle='round,pad=.5',facecolor='yellow',alpha=0.5)
+    #     ax.annotate(labels[idx],
+    #                 xy=(recall[idx],precision[idx]), xycoords='data',
+    #                 xytext=vecPositions[idx], textcoords='offset points',
+    #                 arrowprops=dict(arrowstyle="->", connectionstyle="arc3"),
+    #                 bbox=box)
+
+
+def renderPrecisionRecallCurve(result,
+                               savePath,
+                               method=MethodAveragePrecision.EveryPointInterpolation,
+                               showAP=False,
+                               showInterpolatedPrecision=False,
+                               maxPoints=None):
+    """Render the Precision x Recall curve of a class into <savePath>/<class>.png with the Agg
+    backend, without pyplot (no global state, no window). The image is written atomically (see
+    atomicPath). Arguments are the same as drawPrecisionRecallCurve. Returns the path of the
+    image."""
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    drawPrecisionRecallCurve(figure.add_subplot(), result, method, showAP,
+                             showInterpolatedPrecision, maxPoints)
+    filePath = os.path.join(savePath, str(result['class']) + '.png')
+    with atomicPath(filePath) as tempPath:
+        figure.savefig(tempPath)
+    return filePath
+
+
+def renderPrecisionRecallCurves(results,
+                                savePath,
+                                method=MethodAveragePrecision.EveryPointInterpolation,
+                                showAP=False,
+                                showInterpolatedPrecision=False,
+                                maxPoints=None,
+                                workers=1,
+                                executor=ExecutorType.Process):
+    """Render the Precision x Recall curves of all classes (see renderPrecisionRecallCurve),
+    using a pool of workers if workers > 1. Returns the paths of the images."""
+    if workers is None or workers <= 1 or len(results) < 2:
+        return [
+            renderPrecisionRecallCurve(r, savePath, method, showAP, showInterpolatedPrecision,
+                                       maxPoints) for r in results
+        ]
+    poolClass = getPoolExecutor(executor)
+    with poolClass(max_workers=min(workers, len(results))) as pool:
+        return list(
+            pool.map(renderPrecisionRecallCurve, results, repeat(savePath), repeat(method),
+                     repeat(showAP), repeat(showInterpolatedPrecision), repeat(maxPoints)))
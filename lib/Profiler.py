@@ -0,0 +1,124 @@
+import time
+from contextlib import contextmanager
+
+
+class Profiler:
+    """Collects the time spent in the stages of an evaluation and counters of the work done.
+
+    Stages are timed with the timer context manager and counters are incremented with count:
+
+        profiler = Profiler()
+        with profiler.timer('match', key='dog'):
+            ...
+        profiler.count('IOU evaluations', 42)
+
+    The accumulated values are returned by getReport. If a callback is informed, it is also
+    called for each event as callback(kind, name, key, value), where kind is 'timer' (value in
+    seconds) or 'counter' (value is the increment).
+    """
+
+    enabled = True
+
+    def __init__(self, callback=None):
+        """Constructor.
+        Args:
+            callback (optional): function called for each timer or counter event.
+        """
+        self._callback = callback
+        self.reset()
+
+    def reset(self):
+        """Discard all timers and counters collected so far."""
+        # stage => [seconds, calls, {key: seconds}]
+        self._timers = {}
+        self._counters = {}
+
+    @contextmanager
+    def timer(self, name, key=None):
+        """Context manager adding the time spent in its block to the timer name.
+        Args:
+            name: name of the stage;
+            key (optional): sub-entry of the stage (e.g. a class) the time is also added to.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addTime(name, time.perf_counter() - start, key)
+
+    def addTime(self, name, seconds, key=None):
+        """Add seconds to the timer name (and to its entry key, if informed)."""
+        timer = self._timers.get(name)
+        if timer is None:
+            timer = self._timers[name] = [0.0, 0, {}]
+        timer[0] += seconds
+        timer[1] += 1
+        if key is not None:
+            timer[2][key] = timer[2].get(key, 0.0) + seconds
+        if self._callback is not None:
+            self._callback('timer', name, key, seconds)
+
+    def count(self, name, value=1):
+        """Add value to the counter name."""
+        self._counters[name] = self._counters.get(name, 0) + value
+        if self._callback is not None:
+            self._callback('counter', name, None, value)
+
+    def getReport(self):
+        """Return the collected values as a dictionary with the keys:
+        'timers': dictionary mapping each stage to a dictionary with its total 'seconds', its
+        number of 'calls' and, if keys were used, the 'seconds per key';
+        'counters': dictionary mapping each counter to its value.
+        """
+        timers = {}
+        for name, (seconds, calls, keys) in self._timers.items():
+            timers[name] = {'seconds': seconds, 'calls': calls}
+            if len(keys) > 0:
+                timers[name]['seconds per key'] = dict(keys)
+        return {'timers': timers, 'counters': dict(self._counters)}
+
+    def formatReport(self):
+        """Return the collected values as a human-readable text."""
+        lines = ['Timers:']
+        for name, (seconds, calls, keys) in self._timers.items():
+            lines.append('  %-25s %10.4fs %8d calls' % (name, seconds, calls))
+            for key, keySeconds in keys.items():
+                lines.append('    %-23s %10.4fs' % (key, keySeconds))
+        lines.append('Counters:')
+        for name, value in self._counters.items():
+            lines.append('  %-25s %10d' % (name, value))
+        return '\n'.join(lines)
+
+
+class NullProfiler:
+    """Profiler that discards everything. Used when profiling is disabled: its timer is a shared
+    no-op context manager and callers check enabled before computing expensive counters."""
+
+    enabled = False
+
+    class _NullTimer:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+    _nullTimer = _NullTimer()
+
+    def reset(self):
+        pass
+
+    def timer(self, name, key=None):
+        return NullProfiler._nullTimer
+
+    def addTime(self, name, seconds, key=None):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def getReport(self):
+        return {'timers': {}, 'counters': {}}
+
+    def formatReport(self):
+        return ''
@@ -0,0 +1,208 @@
+import csv
+import json
+import math
+import os
+from enum import Enum
+
+import numpy as np
+
+from OutputManager import getDigest
+from utils import *
+
+# Files written by pascalvoc.py for each output format (-of)
+RESULT_FILES = {
+    'txt': 'results.txt',
+    'json': 'results.json',
+    'csv': 'results.csv',
+    'npz': 'results.npz'
+}
+
+# Columns of the per-class table (CSV), in order. 'precision' and 'recall' are the values at the
+# last detection of the class
+TABLE_COLUMNS = [
+    'class', 'AP', 'AP lower', 'AP upper', 'total positives', 'total TP', 'total FP',
+    'precision', 'recall'
+]
+
+
+def _toJSON(value):
+    """Convert NumPy values into Python values and NaN into None, which JSON does not allow."""
+    if isinstance(value, dict):
+        return {str(k): _toJSON(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_toJSON(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return _toJSON(value.tolist())
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def getMeanAP(results):
+    """Mean of the AP of the classes with ground truths (NaN if there are none), added in the
+    same order as results.txt."""
+    accAP = 0
+    validClasses = 0
+    for r in results:
+        if r['total positives'] > 0:
+            accAP = accAP + r['AP']
+            validClasses = validClasses + 1
+    return accAP / validClasses if validClasses > 0 else float('nan')
+
+
+def getClassRows(results, intervals=None):
+    """One dictionary per class with the values of TABLE_COLUMNS.
+    Args:
+        results: metrics of each class (see Evaluator.GetPascalVOCMetrics);
+        intervals (optional): bootstrap intervals (see Evaluator.GetBootstrapMetrics), whose
+        'classes' map each class to its interval. Without them, 'AP lower' and 'AP upper' are
+        None.
+    Returns:
+        List of dictionaries, with NumPy values converted into Python values and NaN into None.
+    """
+    rows = []
+    for r in results:
+        interval = {} if intervals is None else intervals['classes'].get(r['class'], {})
+        rows.append({
+            'class': r['class'],
+            'AP': r['AP'],
+            'AP lower': interval.get('AP lower', np.nan),
+            'AP upper': interval.get('AP upper', np.nan),
+            'total positives': int(r['total positives']),
+            'total TP': int(r['total TP']),
+            'total FP': int(r['total FP']),
+            'precision': r['precision'][-1] if len(r['precision']) > 0 else np.nan,
+            'recall': r['recall'][-1] if len(r['recall']) > 0 else np.nan
+        })
+    return _toJSON(rows)
+
+
+def writeJSONSummary(filePath, results, intervals=None, extra=None):
+    """Write a JSON file with the mAP and the values of TABLE_COLUMNS of each class (see
+    getClassRows), without the points of the curves.
+    Args:
+        filePath: path of the file written;
+        results: metrics of each class (see Evaluator.GetPascalVOCMetrics);
+        intervals (optional): bootstrap intervals, adding 'mAP lower' and 'mAP upper';
+        extra (optional): dictionary with other values saved at the top of the file (e.g. the
+        parameters of the evaluation).
+    """
+    summary = dict(extra or {})
+    summary['mAP'] = getMeanAP(results)
+    if intervals is not None:
+        summary['mAP lower'] = intervals['mAP lower']
+        summary['mAP upper'] = intervals['mAP upper']
+    summary['classes'] = getClassRows(results, intervals)
+    with open(filePath, 'w') as f:
+        json.dump(_toJSON(summary), f, indent=2)
+
+
+def writeCSVTable(filePath, results, intervals=None):
+    """Write a CSV file with one row per class and the columns TABLE_COLUMNS (see
+    getClassRows). Missing values are left empty."""
+    with open(filePath, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=TABLE_COLUMNS)
+        writer.writeheader()
+        writer.writerows(getClassRows(results, intervals))
+
+
+def writePrecisionRecallArrays(filePath, results, maxPoints=None):
+    """Save the Precision x Recall curves of all classes into a .npz file (read with np.load).
+    The file holds the arrays 'classes', 'AP' and 'positives' (number of ground truths), with
+    one value per class, and 'recall' and 'precision', with the points of all curves one after
+    the other: the points of the i-th class are [offsets[i]:offsets[i + 1]].
+    Args:
+        filePath: path of the file written;
+        results: metrics of each class (see Evaluator.GetPascalVOCMetrics);
+        maxPoints (optional): maximum number of points saved per curve (see decimateCurve).
+        Default: all points are saved.
+    """
+    curves = [decimateCurve(r['recall'], r['precision'], maxPoints) for r in results]
+    offsets = np.zeros(len(curves) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(recall) for recall, _ in curves])
+    np.savez_compressed(
+        filePath,
+        classes=np.array([str(r['class']) for r in results]),
+        AP=np.array([r['AP'] for r in results], dtype=np.float64),
+        positives=np.array([r['total positives'] for r in results], dtype=np.int64),
+        offsets=offsets,
+        recall=np.concatenate([np.empty(0)] + [recall for recall, _ in curves]),
+        precision=np.concatenate([np.empty(0)] + [precision for _, precision in curves]))
+
+
+def writeResultFiles(output,
+                     results,
+                     formats,
+                     maxPoints=None,
+                     intervals=None,
+                     extra=None,
+                     folder=''):
+    """Write the JSON, CSV and npz files of formats (see RESULT_FILES). The text file
+    (results.txt) is written by pascalvoc.py.
+    Args:
+        output: OutputManager of the save folder. Files whose inputs did not change are kept
+        when it resumes a previous run;
+        results, intervals, extra: see writeJSONSummary;
+        formats: list of formats (keys of RESULT_FILES);
+        maxPoints (optional): see writePrecisionRecallArrays;
+        folder (optional): subfolder of the save folder where the files are written.
+    Returns:
+        The names of the files (relative to the save folder).
+    """
+    files = []
+    if 'json' in formats:
+        files.append(os.path.join(folder, RESULT_FILES['json']))
+        output.write(files[-1], lambda path: writeJSONSummary(path, results, intervals, extra),
+                     getDigest(results, intervals, extra))
+    if 'csv' in formats:
+        files.append(os.path.join(folder, RESULT_FILES['csv']))
+        output.write(files[-1], lambda path: writeCSVTable(path, results, intervals),
+                     getDigest(results, intervals))
+    if 'npz' in formats:
+        files.append(os.path.join(folder, RESULT_FILES['npz']))
+        output.write(files[-1], lambda path: writePrecisionRecallArrays(path, results, maxPoints),
+                     getDigest(results, maxPoints))
+    return files
+
+
+def _writeBatchJSON(filePath, sets, extra):
+    summary = dict(extra or {})
+    summary['sets'] = sets
+    with open(filePath, 'w') as f:
+        json.dump(_toJSON(summary), f, indent=2)
+
+
+def _writeBatchCSV(filePath, sets, classes):
+    with open(filePath, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['detections', 'mAP'] + classes)
+        writer.writerows(
+            _toJSON([s['name'], s['mAP']] + [s['AP'].get(c, np.nan) for c in classes])
+            for s in sets)
+
+
+def writeBatchFiles(output, names, allResults, formats, extra=None):
+    """Write the JSON and CSV files of formats with the mAP and the AP of each class of several
+    sets of detections (see pascalvoc.evaluateBatch) through the OutputManager output. The CSV
+    file has one row per set and one column per class; the JSON file, the mAP and the APs of
+    each set. Returns the names of the files."""
+    classes = sorted({r['class'] for results in allResults for r in results
+                      if r['total positives'] > 0})
+    sets = []
+    for name, results in zip(names, allResults):
+        aps = {r['class']: r['AP'] for r in results if r['total positives'] > 0}
+        sets.append({'name': name, 'mAP': getMeanAP(results), 'AP': aps})
+    files = []
+    if 'json' in formats:
+        files.append(RESULT_FILES['json'])
+        output.write(files[-1], lambda path: _writeBatchJSON(path, sets, extra),
+                     getDigest(sets, extra))
+    if 'csv' in formats:
+        files.append(RESULT_FILES['csv'])
+        output.write(files[-1], lambda path: _writeBatchCSV(path, sets, classes),
+                     getDigest(sets, classes))
+    return files
@@ -0,0 +1,134 @@
+import numpy as np
+
+
+class SpatialIndex:
+    """Uniform grid over bounding boxes used to find the pairs of boxes that may overlap.
+
+    Each box (absolute XYX2Y2 coordinates) is registered in every cell of the grid it covers.
+    The cells have the median width and height of the boxes, so for boxes of similar sizes each
+    box covers a few cells, and a query only compares a box against the boxes registered in the
+    cells it can overlap, instead of against all boxes.
+    """
+
+    # Below this number of pairs, comparing all boxes is faster than building the grid
+    minPairs = 4096
+    # Fraction of all pairs above which the candidates are not worth it (each candidate pair
+    # costs several times more than a pair of the full IOU matrix)
+    maxCandidateFraction = 0.1
+
+    def __init__(self, boxes, cellSize=None):
+        """Constructor.
+        Args:
+            boxes: (N, 4) array with the absolute coordinates (XYX2Y2) of the indexed boxes;
+            cellSize (optional): (width, height) of the cells of the grid. Default: the median
+            width and height of the boxes.
+        """
+        self._boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if cellSize is None:
+            if len(self._boxes) > 0:
+                cellSize = (np.median(self._boxes[:, 2] - self._boxes[:, 0] + 1),
+                            np.median(self._boxes[:, 3] - self._boxes[:, 1] + 1))
+            else:
+                cellSize = (1, 1)
+        self._cellWidth = max(float(cellSize[0]), 1.0)
+        self._cellHeight = max(float(cellSize[1]), 1.0)
+        cx1, cy1, cx2, cy2 = self._getCells(self._boxes[:, 0], self._boxes[:, 1],
+                                            self._boxes[:, 2], self._boxes[:, 3])
+        self._minX = int(cx1.min()) if len(cx1) > 0 else 0
+        self._maxX = int(cx2.max()) if len(cx2) > 0 else -1
+        self._minY = int(cy1.min()) if len(cy1) > 0 else 0
+        self._maxY = int(cy2.max()) if len(cy2) > 0 else -1
+        self._cells = (cx1, cy1, cx2, cy2)
+        # The boxes of each cell are only listed by the first query
+        self._keys = None
+        self._boxIds = None
+
+    def _build(self):
+        boxIds, keys = self._expandCells(*self._cells)
+        # Stable sort: inside each cell, boxes keep their original order
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self._boxIds = boxIds[order]
+
+    def getCellCount(self):
+        """Number of cells of the grid (including the empty ones)."""
+        return max(self._maxX - self._minX + 1, 0) * max(self._maxY - self._minY + 1, 0)
+
+    @staticmethod
+    def isIndexable(boxes):
+        """True if all boxes have finite coordinates and positive sizes, as required by the
+        pruning bounds of query."""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        return bool(
+            np.isfinite(boxes).all() and (boxes[:, 2] - boxes[:, 0] + 1 > 0).all() and
+            (boxes[:, 3] - boxes[:, 1] + 1 > 0).all())
+
+    def _getCells(self, x1, y1, x2, y2):
+        return (np.floor(x1 / self._cellWidth).astype(np.int64),
+                np.floor(y1 / self._cellHeight).astype(np.int64),
+                np.floor(x2 / self._cellWidth).astype(np.int64),
+                np.floor(y2 / self._cellHeight).astype(np.int64))
+
+    def _expandCells(self, cx1, cy1, cx2, cy2):
+        """Expand each range of cells [cx1, cx2] x [cy1, cy2] into its cells.
+        Returns the position of the range of each cell and the key of the cell."""
+        columns = np.maximum(cx2 - cx1 + 1, 0)
+        counts = columns * np.maximum(cy2 - cy1 + 1, 0)
+        ids = np.repeat(np.arange(len(counts)), counts)
+        local = np.arange(len(ids)) - np.repeat(np.cumsum(counts) - counts, counts)
+        x = cx1[ids] + local % columns[ids]
+        y = cy1[ids] + local // columns[ids]
+        rows = self._maxY - self._minY + 1
+        return ids, (x - self._minX) * rows + (y - self._minY)
+
+    def query(self, boxes, minIOU=0, maxPairs=None):
+        """Find the pairs (query box, indexed box) that may have an IOU (with +1 pixel areas, as
+        in Evaluator.iou) higher or equal than minIOU. Every pair reaching minIOU is returned,
+        but some of the pairs returned may not reach it.
+        Args:
+            boxes: (M, 4) array with the absolute coordinates (XYX2Y2) of the query boxes, which
+            must be indexable (see isIndexable);
+            minIOU (optional): minimum IOU of the pairs (default = 0: all intersecting pairs);
+            maxPairs (optional): if the grid yields more candidate pairs than maxPairs, the
+            query is abandoned and None is returned.
+        Returns:
+            queries, indexed: positions of the query box and of the indexed box of each pair,
+            sorted by query box and then by indexed box, without repeated pairs.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        empty = np.empty(0, dtype=np.int64)
+        if len(boxes) == 0 or len(self._boxes) == 0:
+            return empty, empty
+        # Small margin so that rounding errors never discard a pair
+        minIOU = max(float(minIOU), 0.0) * (1 - 1e-9)
+        x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+        # IOU >= t implies that the intersection is at least t times the width (and height) of
+        # the query box, so an indexed box must cover the points between lo and hi
+        loX = x1 - 1 + minIOU * (x2 - x1 + 1)
+        hiX = x2 + 1 - minIOU * (x2 - x1 + 1)
+        loY = y1 - 1 + minIOU * (y2 - y1 + 1)
+        hiY = y2 + 1 - minIOU * (y2 - y1 + 1)
+        margin = 1e-6 * (1 + np.abs(boxes).max(axis=1))
+        cx1, cy1, cx2, cy2 = self._getCells(
+            np.minimum(loX, hiX) - margin,
+            np.minimum(loY, hiY) - margin,
+            np.maximum(loX, hiX) + margin,
+            np.maximum(loY, hiY) + margin)
+        # Cells outside the grid contain no boxes
+        cx1 = np.maximum(cx1, self._minX)
+        cy1 = np.maximum(cy1, self._minY)
+        cx2 = np.minimum(cx2, self._maxX)
+        cy2 = np.minimum(cy2, self._maxY)
+        if self._keys is None:
+            self._build()
+        queryIds, keys = self._expandCells(cx1, cy1, cx2, cy2)
+        starts = np.searchsorted(self._keys, keys, side='left')
+        counts = np.searchsorted(self._keys, keys, side='right') - starts
+        if maxPairs is not None and counts.sum() > maxPairs:
+            return None
+        queries = np.repeat(queryIds, counts)
+        local = np.arange(len(queries)) - np.repeat(np.cumsum(counts) - counts, counts)
+        indexed = self._boxIds[np.repeat(starts, counts) + local]
+        # A box covering several cells is found once per cell
+        pairs = np.unique(queries * len(self._boxes) + indexed)
+        return pairs // len(self._boxes), pairs % len(self._boxes)
@@ -0,0 +1,209 @@
+import os
+import tempfile
+
+import numpy as np
+
+from BoundingBox import *
+from Evaluator import *
+from utils import *
+
+
+class StreamingEvaluator:
+    """Evaluator that receives the bounding boxes image by image.
+
+    Each image is matched as soon as it is added: greedy matching only depends on the detections
+    and ground truths of the same image, so the result of each detection (TP or FP) is final.
+    Only the confidence and the TP flag of each detection and the number of ground truths of
+    each class are kept, so the metrics can be computed at any time without reprocessing the
+    images already added. Adding the images in the same order as they appear in a BoundingBoxes
+    gives the same results as Evaluator.GetPascalVOCMetrics.
+
+    With a memory limit, the results kept in memory are written to disk whenever they exceed
+    it, as one run per class sorted by decreasing confidence. The runs are merged when the
+    metrics are computed, so only the detections of one class need to fit in memory then.
+    """
+
+    # Estimated bytes taken by each per-image entry besides its arrays (array headers, tuple)
+    entryOverhead = 300
+
+    def __init__(self,
+                 IOUThreshold=0.5,
+                 method=MethodAveragePrecision.EveryPointInterpolation,
+                 memoryLimit=None,
+                 spillFolder=None):
+        """Constructor.
+        Args:
+            IOUThreshold: IOU threshold indicating which detections will be considered TP or FP
+            (default value = 0.5);
+            method (default = EveryPointInterpolation): method used to calculate the average
+            precision (see Evaluator.GetPascalVOCMetrics);
+            memoryLimit (optional): maximum number of bytes taken by the results kept in memory
+            before they are written to disk (default = None: always kept in memory);
+            spillFolder (optional): folder where a temporary folder with the runs written to
+            disk is created (default = None: the system temporary folder).
+        """
+        self._IOUThreshold = IOUThreshold
+        self._method = method
+        self._memoryLimit = memoryLimit
+        self._spillFolder = spillFolder
+        self._spillDirectory = None
+        self.reset()
+
+    def reset(self):
+        """Remove all images added so far."""
+        # class => list of (confidences, TP flags) arrays, one entry per image
+        self._results = {}
+        # class => number of ground truths
+        self._positives = {}
+        self._images = 0
+        # Estimated bytes taken by self._results
+        self._memoryUsed = 0
+        # class => paths of its runs written to disk, in the order they were written
+        self._runs = {}
+        self._spills = 0
+        if self._spillDirectory is not None:
+            self._spillDirectory.cleanup()
+            self._spillDirectory = None
+
+    def addImage(self, groundTruths, detections):
+        """Match the bounding boxes of an image and accumulate the results of its detections.
+        Args:
+            groundTruths: list of BoundingBox objects with the ground truths of the image;
+            detections: list of BoundingBox objects with the detections of the image.
+        """
+        gtBoxes = {}
+        for bb in groundTruths:
+            gtBoxes.setdefault(bb.getClassId(), []).append(
+                bb.getAbsoluteBoundingBox(BBFormat.XYX2Y2))
+        detBoxes = {}
+        for bb in detections:
+            detBoxes.setdefault(bb.getClassId(), []).append(
+                (bb.getConfidence(), bb.getAbsoluteBoundingBox(BBFormat.XYX2Y2)))
+        self.addImageColumns({c: np.array(b) for c, b in gtBoxes.items()}, {
+            c: (np.array([d[0] for d in dets], dtype=np.float64), np.array([d[1] for d in dets]))
+            for c, dets in detBoxes.items()
+        })
+
+    def addImageColumns(self, groundTruths, detections):
+        """Same as addImage, with the bounding boxes already grouped by class as arrays.
+        Args:
+            groundTruths: dictionary mapping each class to a (G, 4) array with the absolute
+            coordinates (XYX2Y2) of its ground truths in the image;
+            detections: dictionary mapping each class to a tuple (confidences, coordinates) with
+            an array of confidences and a (D, 4) array with the absolute coordinates (XYX2Y2)
+            of its detections in the image.
+        """
+        self.addImageBatch([(groundTruths, detections)])
+
+    def addImageBatch(self, images):
+        """Same as addImageColumns for several images, matching each class once for all of
+        them, which is much faster than adding the images one by one.
+        Args:
+            images: list of (groundTruths, detections) tuples, one per image, as the arguments of
+            addImageColumns.
+        """
+        gts = {}  # class => {image position: ground truths}
+        dets = {}  # class => list of (image position, confidences, coordinates)
+        for i, (groundTruths, detections) in enumerate(images):
+            self._images += 1
+            for c, boxes in groundTruths.items():
+                self._positives[c] = self._positives.get(c, 0) + len(boxes)
+                self._results.setdefault(c, [])
+                if len(boxes) > 0:
+                    gts.setdefault(c, {})[i] = boxes
+            for c, (confidences, boxes) in detections.items():
+                dets.setdefault(c, []).append(
+                    (i, np.asarray(confidences, dtype=np.float64).reshape(-1),
+                     np.asarray(boxes, dtype=np.float64).reshape(-1, 4)))
+        for c, parts in dets.items():
+            imageIds = np.concatenate([np.full(len(p[1]), p[0], dtype=np.int64) for p in parts])
+            confidences = np.concatenate([p[1] for p in parts])
+            # sort detections by decreasing confidence (stable: ties keep the order of the
+            # images and, inside each image, their original order)
+            order = Evaluator.getConfidenceOrder(confidences)
+            confidences = confidences[order]
+            boxes = np.concatenate([p[2] for p in parts])[order]
+            # Detections are only matched with the ground truths of their image
+            ious, gtKeys, _, _ = Evaluator._getBestMatches(imageIds[order], boxes, gts.get(c, {}))
+            TP, _ = Evaluator._assignMatches(ious, gtKeys, self._IOUThreshold)
+            self._results.setdefault(c, []).append((confidences, TP.astype(bool)))
+            self._positives.setdefault(c, 0)
+            self._memoryUsed += confidences.nbytes + len(TP) + self.entryOverhead
+        if self._memoryLimit is not None and self._memoryUsed > self._memoryLimit:
+            self._spill()
+
+    def getImageCount(self):
+        """Number of images added so far."""
+        return self._images
+
+    def getSpillCount(self):
+        """Number of times the results kept in memory were written to disk."""
+        return self._spills
+
+    def _compact(self, c):
+        """Concatenate the accumulated arrays of class c into a single entry."""
+        results = self._results.get(c, [])
+        if len(results) > 1:
+            results[:] = [(np.concatenate([r[0] for r in results]),
+                           np.concatenate([r[1] for r in results]))]
+        if len(results) == 0:
+            return np.empty(0), np.empty(0, dtype=bool)
+        return results[0]
+
+    def _spill(self):
+        """Write the results kept in memory to disk, as one run per class sorted by decreasing
+        confidence, and remove them from memory."""
+        if self._spillDirectory is None:
+            self._spillDirectory = tempfile.TemporaryDirectory(prefix='odm_runs_',
+                                                               dir=self._spillFolder)
+        for i, c in enumerate(list(self._results)):
+            confidences, TP = self._compact(c)
+            if len(confidences) == 0:
+                continue
+            order = Evaluator.getConfidenceOrder(confidences)
+            run = np.empty(len(order), dtype=[('confidence', '<f8'), ('TP', '?')])
+            run['confidence'] = confidences[order]
+            run['TP'] = TP[order]
+            runs = self._runs.setdefault(c, [])
+            path = os.path.join(self._spillDirectory.name, '%d_%d.npy' % (self._spills, i))
+            np.save(path, run)
+            runs.append(path)
+        self._results = {}
+        self._memoryUsed = 0
+        self._spills += 1
+
+    def _getSortedResults(self, c):
+        """Confidences and TP flags of all detections of class c, sorted by decreasing
+        confidence, with ties in the order the images were added."""
+        runs = [np.load(path, mmap_mode='r') for path in self._runs.get(c, [])]
+        confidences, TP = self._compact(c)
+        if len(runs) == 0:
+            order = Evaluator.getConfidenceOrder(confidences)
+            return confidences[order], TP[order]
+        # The runs hold the images in the order they were added, so merging them (followed by
+        # the results still in memory, sorted) keeps that order for ties
+        order = Evaluator.getConfidenceOrder(confidences)
+        shards = [r['confidence'] for r in runs] + [confidences[order]]
+        TP = np.concatenate([r['TP'] for r in runs] + [TP[order]])
+        order = Evaluator.mergeSortedShards(shards)
+        return np.concatenate(shards)[order], TP[order]
+
+    def GetPascalVOCMetrics(self):
+        """Get the metrics of all images added so far.
+        Returns:
+            A list of dictionaries, one per class, as described in
+            Evaluator.GetPascalVOCMetrics.
+        """
+        ret = []
+        for c in sorted(self._positives):
+            # Images are concatenated in the order they were added and each image is sorted, so
+            # a stable sort reproduces the order of Evaluator.GetPascalVOCMetrics
+            TP = self._getSortedResults(c)[1].astype(np.float64)
+            ret.append(Evaluator._getClassMetrics(c, TP, 1 - TP, self._positives[c],
+                                                  self._method))
+        return ret
+
+    def getMeanAveragePrecision(self):
+        """Mean of the AP of the classes with at least one ground truth (NaN if none)."""
+        aps = [r['AP'] for r in self.GetPascalVOCMetrics() if r['total positives'] > 0]
+        return sum(aps) / len(aps) if len(aps) > 0 else float('nan')
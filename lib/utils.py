@@ -1,6 +1,6 @@
 from enum import Enum
 
-import cv2
+import numpy as np
 
 
 class MethodAveragePrecision(Enum):
@@ -51,6 +51,92 @@ class BBFormat(Enum):
     XYX2Y2 = 2
 
 
+class MatchingEngine(Enum):
+    """
+    Class representing how detections are matched against the ground truths.
+    Scalar computes the IOU of each detection/ground truth pair in pure Python.
+    Vectorized computes, with NumPy, the IOU matrix of all detections and ground truths of an
+    image at once. SpatialIndex indexes the ground truths of each image in a grid and only
+    computes the IOUs of the pairs that may reach the IOU threshold. All produce identical
+    results.
+    """
+    Scalar = 1
+    Vectorized = 2
+    SpatialIndex = 3
+
+
+class ExecutorType(Enum):
+    """
+    Class representing the kind of pool used to evaluate classes in parallel.
+    """
+    Process = 1
+    Thread = 2
+
+
+class SignificanceTest(Enum):
+    """
+    Class representing the paired test used to compare two sets of detections of the same
+    images. Permutation randomly swaps the detections of the two sets in each image. Bootstrap
+    resamples the images with replacement.
+    """
+    Permutation = 1
+    Bootstrap = 2
+
+
+class OutputMode(Enum):
+    """
+    Class representing what is done with the files of a save folder that already has results.
+    Ask asks the user whether the results can be replaced. Overwrite writes all results again.
+    Resume only writes the results whose inputs changed since the previous run.
+    """
+    Ask = 1
+    Overwrite = 2
+    Resume = 3
+
+
+def getPoolExecutor(executor):
+    """Return the concurrent.futures pool class of an ExecutorType. concurrent.futures is only
+    imported when a pool is created, which keeps it out of the start-up of single worker runs."""
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    return ThreadPoolExecutor if executor == ExecutorType.Thread else ProcessPoolExecutor
+
+
+def decimateCurve(x, y, maxPoints):
+    """Reduce a curve to at most maxPoints vertices keeping its shape.
+    The points are split into maxPoints / 4 consecutive buckets and, from each bucket, only the
+    first and last points and the points with the lowest and highest y are kept, so the drawn
+    envelope of the curve does not change.
+    Args:
+        x, y: coordinates of the points of the curve;
+        maxPoints: maximum number of points kept (None keeps all points).
+    Returns:
+        The x and y coordinates of the points kept, in their original order.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(y)
+    if maxPoints is None or n <= maxPoints:
+        return x, y
+    buckets = max(maxPoints // 4, 1)
+    starts = np.linspace(0, n, buckets + 1).astype(np.int64)
+    sizes = np.diff(starts)
+    starts = starts[:-1][sizes > 0]
+    sizes = sizes[sizes > 0]
+    bucketIds = np.repeat(np.arange(len(sizes)), sizes)
+    lowest = _getFirstPerBucket(y == np.repeat(np.minimum.reduceat(y, starts), sizes), bucketIds)
+    highest = _getFirstPerBucket(y == np.repeat(np.maximum.reduceat(y, starts), sizes), bucketIds)
+    keep = np.unique(np.concatenate((starts, starts + sizes - 1, lowest, highest)))
+    return x[keep], y[keep]
+
+
+def _getFirstPerBucket(mask, bucketIds):
+    """Position of the first True value of mask in each bucket (buckets without True values are
+    skipped). bucketIds must be sorted."""
+    idx = np.flatnonzero(mask)
+    buckets = bucketIds[idx]
+    return idx[np.concatenate(([True], buckets[1:] != buckets[:-1]))] if len(idx) > 0 else idx
+
+
 # size => (width, height) of the image
 # box => (X1, X2, Y1, Y2) of the bounding box
 def convertToRelativeValues(size, box):
@@ -95,6 +181,8 @@ def add_bb_into_image(image, bb, color=(255, 0, 0), thickness=2, label=None):
     g = int(color[1])
     b = int(color[2])
 
+    # OpenCV is only needed to draw bounding boxes, so it is not imported with this module
+    import cv2
     font = cv2.FONT_HERSHEY_SIMPLEX
     fontScale = 0.5
     fontThickness = 1
@@ -47,14 +47,22 @@
 
 import argparse
 import glob
+import json
 import os
-import shutil
 import sys
+import time
+from itertools import repeat
 
 import _init_paths
 from BoundingBox import BoundingBox
 from BoundingBoxes import BoundingBoxes
+from BoundingBoxesLoader import iterImages, loadBoundingBoxes
 from Evaluator import *
+from OutputManager import OutputManager, getDigest
+from PackedBoundingBoxes import isPackedFile, loadPackedBoundingBoxes
+from Profiler import Profiler
+from ResultsWriter import RESULT_FILES, writeBatchFiles, writeResultFiles
+from StreamingEvaluator import StreamingEvaluator
 from utils import BBFormat
 
 
@@ -111,9 +119,11 @@ def ValidateCoordinatesTypes(arg, argName, errors):
     errors.append('argument %s: invalid value. It must be either \'rel\' or \'abs\'' % argName)
 
 
-def ValidatePaths(arg, nameArg, errors):
+def ValidatePaths(arg, nameArg, errors, allowPackedFile=False):
     if arg is None:
         errors.append('argument %s: invalid directory' % nameArg)
+    elif allowPackedFile and isPackedFile(os.path.join(currentPath, arg)):
+        arg = os.path.join(currentPath, arg)
     elif os.path.isdir(arg) is False and os.path.isdir(os.path.join(currentPath, arg)) is False:
         errors.append('argument %s: directory does not exist \'%s\'' % (nameArg, arg))
     # elif os.path.isdir(os.path.join(currentPath, arg)) is True:
@@ -123,296 +133,914 @@ def ValidatePaths(arg, nameArg, errors):
     return arg
 
 
+def ExpandPatterns(args):
+    """Replace the glob patterns of a list of paths by the folders (and packed files) that they
+    match, in alphabetical order. A pattern without matches is kept, so ValidatePaths reports
+    it."""
+    paths = []
+    for arg in args:
+        if not any(c in arg for c in '*?['):
+            paths.append(arg)
+            continue
+        matches = glob.glob(arg) or glob.glob(os.path.join(currentPath, arg))
+        matches = sorted(m for m in matches if os.path.isdir(m) or isPackedFile(m))
+        paths.extend(matches if matches else [arg])
+    return paths
+
+
 def getBoundingBoxes(directory,
                      isGT,
                      bbFormat,
                      coordType,
                      allBoundingBoxes=None,
                      allClasses=None,
-                     imgSize=(0, 0)):
-    """Read txt files containing bounding boxes (ground truth and detections)."""
-    if allBoundingBoxes is None:
-        allBoundingBoxes = BoundingBoxes()
+                     imgSize=(0, 0),
+                     workers=1,
+                     profiler=None,
+                     cacheFolder=None,
+                     minConfidence=None,
+                     maxDets=None,
+                     maxDetsPerClass=False):
+    """Read txt files containing bounding boxes (ground truth and detections), or a packed file
+    written by PackedBoundingBoxes (isGT None reads both its ground truths and its detections).
+    Detections can be discarded while they are read (see BoundingBoxesLoader.selectDetections).
+    """
     if allClasses is None:
         allClasses = []
-    # Read ground truths
-    os.chdir(directory)
-    files = glob.glob("*.txt")
-    files.sort()
-    # Read GT detections from txt file
+    # Read all files of the folder at once into columns (see BoundingBoxesLoader)
     # Each line of the files in the groundtruths folder represents a ground truth bounding box
     # (bounding boxes that a detector should detect)
     # Each value of each line is  "class_id, x, y, width, height" respectively
     # Class_id represents the class of the bounding box
     # x, y represents the most top-left coordinates of the bounding box
     # x2, y2 represents the most bottom-right coordinates of the bounding box
-    for f in files:
-        nameOfImage = f.replace(".txt", "")
-        fh1 = open(f, "r")
-        for line in fh1:
-            line = line.replace("\n", "")
-            if line.replace(' ', '') == '':
-                continue
-            splitLine = line.split(" ")
-            if isGT:
-                # idClass = int(splitLine[0]) #class
-                idClass = (splitLine[0])  # class
-                x = float(splitLine[1])
-                y = float(splitLine[2])
-                w = float(splitLine[3])
-                h = float(splitLine[4])
-                bb = BoundingBox(nameOfImage,
-                                 idClass,
-                                 x,
-                                 y,
-                                 w,
-                                 h,
-                                 coordType,
-                                 imgSize,
-                                 BBType.GroundTruth,
-                                 format=bbFormat)
-            else:
-                # idClass = int(splitLine[0]) #class
-                idClass = (splitLine[0])  # class
-                confidence = float(splitLine[1])
-                x = float(splitLine[2])
-                y = float(splitLine[3])
-                w = float(splitLine[4])
-                h = float(splitLine[5])
-                bb = BoundingBox(nameOfImage,
-                                 idClass,
-                                 x,
-                                 y,
-                                 w,
-                                 h,
-                                 coordType,
-                                 imgSize,
-                                 BBType.Detected,
-                                 confidence,
-                                 format=bbFormat)
-            allBoundingBoxes.addBoundingBox(bb)
-            if idClass not in allClasses:
-                allClasses.append(idClass)
-        fh1.close()
+    if isPackedFile(directory):
+        allBoundingBoxes, stats = loadPackedBoundingBoxes(directory, isGT, allBoundingBoxes,
+                                                          minConfidence, maxDets,
+                                                          maxDetsPerClass)
+    else:
+        allBoundingBoxes, stats = loadBoundingBoxes(directory,
+                                                    isGT,
+                                                    bbFormat,
+                                                    coordType,
+                                                    allBoundingBoxes,
+                                                    imgSize=imgSize,
+                                                    workers=workers,
+                                                    cacheFolder=cacheFolder,
+                                                    minConfidence=minConfidence,
+                                                    maxDets=maxDets,
+                                                    maxDetsPerClass=maxDetsPerClass)
+    print('Loaded %d bounding boxes from %d files in %.2fs (%.0f boxes/s)%s' %
+          (stats['boxes'], stats['files'], stats['seconds'], stats['boxes per second'],
+           ' from the cache' if stats['cached'] else ''))
+    if stats['discarded'] > 0:
+        print('Discarded %d detections (%s)' %
+              (stats['discarded'], describePruning(minConfidence, maxDets, maxDetsPerClass)))
+    if profiler is not None:
+        profiler.addTime('load', stats['seconds'], {
+            True: 'ground truths',
+            False: 'detections',
+            None: 'ground truths and detections'
+        }[isGT])
+        profiler.count('files read', stats['files'])
+        profiler.count('boxes loaded', stats['boxes'])
+        profiler.count('detections discarded', stats['discarded'])
+    knownClasses = set(allClasses)
+    for c in allBoundingBoxes.getClasses():
+        if c not in knownClasses:
+            knownClasses.add(c)
+            allClasses.append(c)
     return allBoundingBoxes, allClasses
 
 
+def describePruning(minConfidence, maxDets, maxDetsPerClass):
+    """Text describing the detections kept by -minconf and -maxdets (None if all are kept)."""
+    rules = []
+    if minConfidence is not None:
+        rules.append('confidence >= %g' % minConfidence)
+    if maxDets is not None:
+        rules.append('at most %d per %s' % (maxDets, 'image and class' if maxDetsPerClass else
+                                            'image'))
+    return ', '.join(rules) if rules else None
+
+
+def formatInterval(result, key, intervals):
+    """Text with the bootstrap confidence interval of result[key], where result is intervals or
+    one of its classes (see Evaluator.GetBootstrapMetrics)."""
+    return ' (%d%% CI: %.2f%% - %.2f%%, %d resamples)' % (
+        round(intervals['confidence level'] * 100), result[key + ' lower'] * 100,
+        result[key + ' upper'] * 100, intervals['resamples'])
+
+
+def formatComparison(comparison, compareFolder):
+    """Text with the result of the paired test of -det against compareFolder (see
+    Evaluator.GetPairedTest)."""
+    text = 'Paired %s test against %s: mAP %.2f%% vs %.2f%%, difference %.2f%%' % (
+        comparison['test'].name.lower(), compareFolder, comparison['mAP A'] * 100,
+        comparison['mAP B'] * 100, comparison['difference'] * 100)
+    if comparison['test'] == SignificanceTest.Bootstrap:
+        text += ' (%d%% CI: %.2f%% - %.2f%%)' % (round(comparison['confidence level'] * 100),
+                                                comparison['difference lower'] * 100,
+                                                comparison['difference upper'] * 100)
+    return text + ', p-value %.4f (%d %s)' % (
+        comparison['p-value'], comparison['iterations'],
+        'permutations' if comparison['test'] == SignificanceTest.Permutation else 'resamples')
+
+
+def writeResults(output,
+                 fileName,
+                 detections,
+                 pruning=None,
+                 intervals=None,
+                 comparison=None,
+                 verbose=True):
+    """Write the AP, precision and recall of each class with ground truths and the mAP into
+    fileName (results.txt), printing them if verbose.
+    Args:
+        output: OutputManager of the save folder;
+        fileName: name of the file written, relative to the save folder (None to only print the
+        results). The file is kept if it is up to date (see OutputManager.isUpToDate);
+        detections: metrics of each class (see Evaluator.GetPascalVOCMetrics);
+        pruning (optional): text describing the detections kept (see describePruning);
+        intervals (optional): bootstrap confidence intervals (see formatInterval);
+        comparison (optional): text with the result of a paired test (see formatComparison).
+    Returns:
+        The mAP.
+    """
+    acc_AP = 0
+    validClasses = 0
+    digest = None
+    if fileName is not None:
+        digest = getDigest(detections, pruning, intervals, comparison)
+        if output.isUpToDate(fileName, digest):
+            # The precision and recall are only formatted if the file is written
+            output.keep(fileName)
+            fileName = None
+
+    # The text is built in memory and written at once
+    text = ['Object Detection Metrics\n']
+    text.append('https://github.com/rafaelpadilla/Object-Detection-Metrics\n\n\n')
+    if pruning is not None:
+        if verbose:
+            print('Detections kept: %s' % pruning)
+        text.append('Detections kept: %s\n\n' % pruning)
+    text.append('Average Precision (AP), Precision and Recall per class:')
+
+    # each detection is a class
+    for metricsPerClass in detections:
+
+        # Get metric values per each class
+        cl = metricsPerClass['class']
+        ap = metricsPerClass['AP']
+        precision = metricsPerClass['precision']
+        recall = metricsPerClass['recall']
+        totalPositives = metricsPerClass['total positives']
+        total_TP = metricsPerClass['total TP']
+        total_FP = metricsPerClass['total FP']
+
+        if totalPositives > 0:
+            validClasses = validClasses + 1
+            acc_AP = acc_AP + ap
+            ap_str = "{0:.2f}%".format(ap * 100)
+            # ap_str = "{0:.4f}%".format(ap * 100)
+            if intervals is not None:
+                ap_str += formatInterval(intervals['classes'][cl], 'AP', intervals)
+            if verbose:
+                print('AP: %s (%s)' % (ap_str, cl))
+            if fileName is not None:
+                prec = ['%.2f' % p for p in precision]
+                rec = ['%.2f' % r for r in recall]
+                text.append('\n\nClass: %s' % cl)
+                text.append('\nAP: %s' % ap_str)
+                text.append('\nPrecision: %s' % prec)
+                text.append('\nRecall: %s' % rec)
+
+    mAP = acc_AP / validClasses
+    mAP_str = "{0:.2f}%".format(mAP * 100)
+    if intervals is not None:
+        mAP_str += formatInterval(intervals, 'mAP', intervals)
+    if verbose:
+        print('mAP: %s' % mAP_str)
+    text.append('\n\n\nmAP: %s' % mAP_str)
+    if comparison is not None:
+        if verbose:
+            print(comparison)
+        text.append('\n\n%s' % comparison)
+    if fileName is not None:
+        output.write(fileName, lambda path: writeText(path, text), digest)
+    return mAP
+
+
+def writeText(filePath, text):
+    """Write the list of strings text into filePath."""
+    with open(filePath, 'w') as f:
+        f.write(''.join(text))
+
+
+def saveResultPlots(output, evaluator, detections, folder='', showGraphic=False, workers=1):
+    """Save the Precision x Recall curve of each class into <folder>/<class>.png through the
+    OutputManager output (folder is relative to the save folder). When a previous run is
+    resumed, only the curves of the classes whose metrics changed are rendered, unless the plots
+    are shown (showGraphic), which renders all of them."""
+    method = MethodAveragePrecision.EveryPointInterpolation
+    names = [os.path.join(folder, str(r['class']) + '.png') for r in detections]
+    digests = [getDigest(r, method) for r in detections]
+    stale = [
+        showGraphic or not output.isUpToDate(name, digest)
+        for name, digest in zip(names, digests)
+    ]
+    if any(stale):
+        os.makedirs(output.getPath(folder), exist_ok=True)
+        evaluator.PlotResults([r for r, s in zip(detections, stale) if s],
+                              method,
+                              showAP=True,
+                              showInterpolatedPrecision=False,
+                              savePath=output.getPath(folder),
+                              showGraphic=showGraphic,
+                              workers=workers)
+    for name, digest, s in zip(names, digests, stale):
+        if s:
+            output.addFile(name, digest)
+        else:
+            output.keep(name)
+
+
+def evaluateStreaming(gtFolder,
+                      detFolder,
+                      gtFormat,
+                      detFormat,
+                      gtCoordType,
+                      detCoordType,
+                      imgSize,
+                      iouThreshold,
+                      memoryLimit,
+                      profiler=None,
+                      minConfidence=None,
+                      maxDets=None,
+                      maxDetsPerClass=False):
+    """Evaluate the detections reading the folders image by image (see StreamingEvaluator), so
+    that the results kept in memory never take more than memoryLimit bytes."""
+    start = time.perf_counter()
+    evaluator = StreamingEvaluator(iouThreshold,
+                                   MethodAveragePrecision.EveryPointInterpolation,
+                                   memoryLimit=memoryLimit)
+    batch = []
+    for _, groundTruths, detections in iterImages(gtFolder, detFolder, gtFormat, detFormat,
+                                                  gtCoordType, detCoordType, imgSize,
+                                                  minConfidence=minConfidence,
+                                                  maxDets=maxDets,
+                                                  maxDetsPerClass=maxDetsPerClass):
+        batch.append((groundTruths, detections))
+        # Images are matched in small batches, which is much faster than one by one
+        if len(batch) == 1000:
+            evaluator.addImageBatch(batch)
+            batch = []
+    evaluator.addImageBatch(batch)
+    results = evaluator.GetPascalVOCMetrics()
+    seconds = time.perf_counter() - start
+    print('Evaluated %d images in %.2fs (results written to disk %d times)' %
+          (evaluator.getImageCount(), seconds, evaluator.getSpillCount()))
+    if profiler is not None:
+        profiler.addTime('streaming evaluation', seconds)
+        profiler.count('images', evaluator.getImageCount())
+        profiler.count('spills', evaluator.getSpillCount())
+    return results
+
+
+# Ground truths of a batch, set once in each worker of the pool (see evaluateBatch)
+_batchGroundTruths = None
+
+
+def _setBatchGroundTruths(groundTruths):
+    global _batchGroundTruths
+    _batchGroundTruths = groundTruths
+
+
+def evaluateDetectionSet(detFolder,
+                         detFormat,
+                         detCoordType,
+                         imgSize,
+                         iouThreshold,
+                         cacheFolder=None,
+                         minConfidence=None,
+                         maxDets=None,
+                         maxDetsPerClass=False,
+                         engine=MatchingEngine.Scalar,
+                         profiler=None):
+    """Read the detections of detFolder and evaluate them against the ground truths of the
+    batch with the MatchingEngine engine. Returns the metrics of each class (see
+    Evaluator.GetPascalVOCMetrics)."""
+    detections, _ = getBoundingBoxes(detFolder,
+                                     False,
+                                     detFormat,
+                                     detCoordType,
+                                     imgSize=imgSize,
+                                     profiler=profiler,
+                                     cacheFolder=cacheFolder,
+                                     minConfidence=minConfidence,
+                                     maxDets=maxDets,
+                                     maxDetsPerClass=maxDetsPerClass)
+    return Evaluator(profiler).GetPascalVOCMetrics(
+        detections,
+        IOUThreshold=iouThreshold,
+        method=MethodAveragePrecision.EveryPointInterpolation,
+        engine=engine,
+        groundTruths=_batchGroundTruths)
+
+
+def getSetNames(detFolders):
+    """Name of each set of detections of a batch: its path relative to the common folder of all
+    sets."""
+    commonPath = os.path.commonpath([os.path.abspath(f) for f in detFolders])
+    return [os.path.relpath(os.path.abspath(f), commonPath) for f in detFolders]
+
+
+def writeBatchResults(output, names, mAPs, allDetections, pruning=None):
+    """Write into results.txt (through the OutputManager output) a table with the mAP and the AP
+    of each class (columns) of each set of detections of a batch (rows)."""
+    classes = sorted({r['class'] for d in allDetections for r in d if r['total positives'] > 0})
+    header = ['Detections', 'mAP'] + [str(c) for c in classes]
+    rows = []
+    for name, mAP, detections in zip(names, mAPs, allDetections):
+        aps = {r['class']: r['AP'] for r in detections if r['total positives'] > 0}
+        rows.append([name, '%.2f%%' % (mAP * 100)] +
+                    ['%.2f%%' % (aps[c] * 100) if c in aps else '-' for c in classes])
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    text = ['Object Detection Metrics\n']
+    text.append('https://github.com/rafaelpadilla/Object-Detection-Metrics\n\n\n')
+    if pruning is not None:
+        text.append('Detections kept: %s\n\n' % pruning)
+    text.append('Average Precision (AP) per class and mAP of each set of detections:\n\n')
+    for row in [header] + rows:
+        text.append('  '.join(v.ljust(w) for v, w in zip(row, widths)).rstrip() + '\n')
+    output.write(RESULT_FILES['txt'], lambda path: writeText(path, text), getDigest(text))
+
+
+def evaluateBatch(gtFolder,
+                  detFolders,
+                  gtFormat,
+                  detFormat,
+                  gtCoordType,
+                  detCoordType,
+                  imgSize,
+                  iouThreshold,
+                  output,
+                  metricsOnly=False,
+                  workers=1,
+                  profiler=None,
+                  cacheFolder=None,
+                  minConfidence=None,
+                  maxDets=None,
+                  maxDetsPerClass=False,
+                  outputFormats=('txt', ),
+                  maxPoints=None,
+                  parameters=None,
+                  engine=MatchingEngine.Scalar):
+    """Evaluate several sets of detections of the same images. The ground truths are read and
+    grouped by class and image once (see Evaluator.GetGroundTruthIndex), then the sets are
+    evaluated one by one, or by a pool of workers processes if workers > 1. The results and plots
+    of each set are saved in a subfolder of the save folder of the OutputManager output (see
+    getSetNames), and a table with the AP of all sets in its results.txt (and .csv, .json, see
+    ResultsWriter.writeBatchFiles). outputFormats, maxPoints and parameters are described in
+    ResultsWriter.writeResultFiles, and engine in Evaluator.GetPascalVOCMetrics."""
+    groundTruths, _ = getBoundingBoxes(gtFolder,
+                                       True,
+                                       gtFormat,
+                                       gtCoordType,
+                                       imgSize=imgSize,
+                                       workers=workers,
+                                       profiler=profiler,
+                                       cacheFolder=cacheFolder)
+    _setBatchGroundTruths(Evaluator(profiler).GetGroundTruthIndex(groundTruths))
+    del groundTruths
+    arguments = [
+        detFolders,
+        repeat(detFormat),
+        repeat(detCoordType),
+        repeat(imgSize),
+        repeat(iouThreshold),
+        repeat(cacheFolder),
+        repeat(minConfidence),
+        repeat(maxDets),
+        repeat(maxDetsPerClass),
+        repeat(engine)
+    ]
+    if workers > 1:
+        # Each worker receives the ground truths once, not with every set
+        poolClass = getPoolExecutor(ExecutorType.Process)
+        with poolClass(max_workers=min(workers, len(detFolders)),
+                       initializer=_setBatchGroundTruths,
+                       initargs=(_batchGroundTruths, )) as pool:
+            allDetections = list(pool.map(evaluateDetectionSet, *arguments))
+    else:
+        allDetections = list(map(evaluateDetectionSet, *arguments, repeat(profiler)))
+    names = getSetNames(detFolders)
+    pruning = describePruning(minConfidence, maxDets, maxDetsPerClass)
+    if pruning is not None:
+        print('Detections kept: %s' % pruning)
+    mAPs = []
+    for name, detections in zip(names, allDetections):
+        txtName = os.path.join(name, RESULT_FILES['txt']) if 'txt' in outputFormats else None
+        mAPs.append(writeResults(output, txtName, detections, pruning, verbose=False))
+        print('mAP: %.2f%% (%s)' % (mAPs[-1] * 100, name))
+        writeResultFiles(output,
+                         detections,
+                         outputFormats,
+                         maxPoints,
+                         extra=dict(parameters or {}, detections=name),
+                         folder=name)
+        if not metricsOnly:
+            saveResultPlots(output, Evaluator(profiler), detections, name, workers=workers)
+    if 'txt' in outputFormats:
+        writeBatchResults(output, names, mAPs, allDetections, pruning)
+    writeBatchFiles(output, names, allDetections, outputFormats, parameters)
+    _setBatchGroundTruths(None)
+
+
 # Get current path to set default folders
 currentPath = os.path.dirname(os.path.abspath(__file__))
 
 VERSION = '0.2 (beta)'
 
-with open('message.txt', 'r') as f:
-    message = f'\n\n{f.read()}\n\n'
-
-print(message)
-
-parser = argparse.ArgumentParser(
-    prog='Object Detection Metrics - Pascal VOC',
-    description=
-    f'{message}\nThis project applies the most popular metrics used to evaluate object detection '
-    'algorithms.\nThe current implemention runs the Pascal VOC metrics.\nFor further references, '
-    'please check:\nhttps://github.com/rafaelpadilla/Object-Detection-Metrics',
-    epilog="Developed by: Rafael Padilla (rafael.padilla@smt.ufrj.br)")
-parser.add_argument('-v', '--version', action='version', version='%(prog)s ' + VERSION)
-# Positional arguments
-# Mandatory
-parser.add_argument('-gt',
-                    '--gtfolder',
-                    dest='gtFolder',
-                    default=os.path.join(currentPath, 'groundtruths'),
-                    metavar='',
-                    help='folder containing your ground truth bounding boxes')
-parser.add_argument('-det',
-                    '--detfolder',
-                    dest='detFolder',
-                    default=os.path.join(currentPath, 'detections'),
-                    metavar='',
-                    help='folder containing your detected bounding boxes')
-# Optional
-parser.add_argument('-t',
-                    '--threshold',
-                    dest='iouThreshold',
-                    type=float,
-                    default=0.5,
-                    metavar='',
-                    help='IOU threshold. Default 0.5')
-parser.add_argument('-gtformat',
-                    dest='gtFormat',
-                    metavar='',
-                    default='xywh',
-                    help='format of the coordinates of the ground truth bounding boxes: '
-                    '(\'xywh\': <left> <top> <width> <height>)'
-                    ' or (\'xyrb\': <left> <top> <right> <bottom>)')
-parser.add_argument('-detformat',
-                    dest='detFormat',
-                    metavar='',
-                    default='xywh',
-                    help='format of the coordinates of the detected bounding boxes '
-                    '(\'xywh\': <left> <top> <width> <height>) '
-                    'or (\'xyrb\': <left> <top> <right> <bottom>)')
-parser.add_argument('-gtcoords',
-                    dest='gtCoordinates',
-                    default='abs',
-                    metavar='',
-                    help='reference of the ground truth bounding box coordinates: absolute '
-                    'values (\'abs\') or relative to its image size (\'rel\')')
-parser.add_argument('-detcoords',
-                    default='abs',
-                    dest='detCoordinates',
-                    metavar='',
-                    help='reference of the ground truth bounding box coordinates: '
-                    'absolute values (\'abs\') or relative to its image size (\'rel\')')
-parser.add_argument('-imgsize',
-                    dest='imgSize',
-                    metavar='',
-                    help='image size. Required if -gtcoords or -detcoords are \'rel\'')
-parser.add_argument('-sp',
-                    '--savepath',
-                    dest='savePath',
-                    metavar='',
-                    help='folder where the plots are saved')
-parser.add_argument('-np',
-                    '--noplot',
-                    dest='showPlot',
-                    action='store_false',
-                    help='no plot is shown during execution')
-args = parser.parse_args()
-
-iouThreshold = args.iouThreshold
-
-# Arguments validation
-errors = []
-# Validate formats
-gtFormat = ValidateFormats(args.gtFormat, '-gtformat', errors)
-detFormat = ValidateFormats(args.detFormat, '-detformat', errors)
-# Groundtruth folder
-if ValidateMandatoryArgs(args.gtFolder, '-gt/--gtfolder', errors):
-    gtFolder = ValidatePaths(args.gtFolder, '-gt/--gtfolder', errors)
-else:
-    # errors.pop()
-    gtFolder = os.path.join(currentPath, 'groundtruths')
-    if os.path.isdir(gtFolder) is False:
-        errors.append('folder %s not found' % gtFolder)
-# Coordinates types
-gtCoordType = ValidateCoordinatesTypes(args.gtCoordinates, '-gtCoordinates', errors)
-detCoordType = ValidateCoordinatesTypes(args.detCoordinates, '-detCoordinates', errors)
-imgSize = (0, 0)
-if gtCoordType == CoordinatesType.Relative:  # Image size is required
-    imgSize = ValidateImageSize(args.imgSize, '-imgsize', '-gtCoordinates', errors)
-if detCoordType == CoordinatesType.Relative:  # Image size is required
-    imgSize = ValidateImageSize(args.imgSize, '-imgsize', '-detCoordinates', errors)
-# Detection folder
-if ValidateMandatoryArgs(args.detFolder, '-det/--detfolder', errors):
-    detFolder = ValidatePaths(args.detFolder, '-det/--detfolder', errors)
-else:
-    # errors.pop()
-    detFolder = os.path.join(currentPath, 'detections')
-    if os.path.isdir(detFolder) is False:
-        errors.append('folder %s not found' % detFolder)
-if args.savePath is not None:
-    savePath = ValidatePaths(args.savePath, '-sp/--savepath', errors)
-else:
-    savePath = os.path.join(currentPath, 'results')
-# Validate savePath
-# If error, show error messages
-if len(errors) != 0:
-    print("""usage: Object Detection Metrics [-h] [-v] [-gt] [-det] [-t] [-gtformat]
-                                [-detformat] [-save]""")
-    print('Object Detection Metrics: error(s): ')
-    [print(e) for e in errors]
-    sys.exit()
-
-# Check if path to save results already exists and is not empty
-if os.path.isdir(savePath) and os.listdir(savePath):
-    key_pressed = ''
-    while key_pressed.upper() not in ['Y', 'N']:
-        print(f'Folder {savePath} already exists and may contain important results.\n')
-        print(f'Enter \'Y\' to continue. WARNING: THIS WILL REMOVE ALL THE CONTENTS OF THE FOLDER!')
-        print(f'Or enter \'N\' to abort and choose another folder to save the results.')
-        key_pressed = input('')
-
-    if key_pressed.upper() == 'N':
-        print('Process canceled')
+# MatchingEngine chosen with -engine
+MATCHING_ENGINES = {
+    'scalar': MatchingEngine.Scalar,
+    'vectorized': MatchingEngine.Vectorized,
+    'spatial': MatchingEngine.SpatialIndex
+}
+
+
+def main():
+    with open(os.path.join(currentPath, 'message.txt'), 'r') as f:
+        message = f'\n\n{f.read()}\n\n'
+
+    parser = argparse.ArgumentParser(
+        prog='Object Detection Metrics - Pascal VOC',
+        description=
+        f'{message}\nThis project applies the most popular metrics used to evaluate object '
+        'detection algorithms.\nThe current implemention runs the Pascal VOC metrics.\nFor further '
+        'references, please check:\nhttps://github.com/rafaelpadilla/Object-Detection-Metrics',
+        epilog="Developed by: Rafael Padilla (rafael.padilla@smt.ufrj.br)")
+    parser.add_argument('-v', '--version', action='version', version='%(prog)s ' + VERSION)
+    # Positional arguments
+    # Mandatory
+    parser.add_argument('-gt',
+                        '--gtfolder',
+                        dest='gtFolder',
+                        default=os.path.join(currentPath, 'groundtruths'),
+                        metavar='',
+                        help='folder containing your ground truth bounding boxes')
+    parser.add_argument('-det',
+                        '--detfolder',
+                        dest='detFolder',
+                        nargs='+',
+                        default=[os.path.join(currentPath, 'detections')],
+                        metavar='',
+                        help='folder containing your detected bounding boxes. Several folders '
+                        '(or glob patterns, e.g. \'runs/*/detections\') are evaluated against '
+                        'the same ground truths, each one saved in a subfolder of -sp')
+    # Optional
+    parser.add_argument('-t',
+                        '--threshold',
+                        dest='iouThreshold',
+                        type=float,
+                        default=0.5,
+                        metavar='',
+                        help='IOU threshold. Default 0.5')
+    parser.add_argument('-gtformat',
+                        dest='gtFormat',
+                        metavar='',
+                        default='xywh',
+                        help='format of the coordinates of the ground truth bounding boxes: '
+                        '(\'xywh\': <left> <top> <width> <height>)'
+                        ' or (\'xyrb\': <left> <top> <right> <bottom>)')
+    parser.add_argument('-detformat',
+                        dest='detFormat',
+                        metavar='',
+                        default='xywh',
+                        help='format of the coordinates of the detected bounding boxes '
+                        '(\'xywh\': <left> <top> <width> <height>) '
+                        'or (\'xyrb\': <left> <top> <right> <bottom>)')
+    parser.add_argument('-gtcoords',
+                        dest='gtCoordinates',
+                        default='abs',
+                        metavar='',
+                        help='reference of the ground truth bounding box coordinates: absolute '
+                        'values (\'abs\') or relative to its image size (\'rel\')')
+    parser.add_argument('-detcoords',
+                        default='abs',
+                        dest='detCoordinates',
+                        metavar='',
+                        help='reference of the ground truth bounding box coordinates: '
+                        'absolute values (\'abs\') or relative to its image size (\'rel\')')
+    parser.add_argument('-imgsize',
+                        dest='imgSize',
+                        metavar='',
+                        help='image size. Required if -gtcoords or -detcoords are \'rel\'')
+    parser.add_argument('-sp',
+                        '--savepath',
+                        dest='savePath',
+                        metavar='',
+                        help='folder where the plots are saved')
+    parser.add_argument('-np',
+                        '--noplot',
+                        dest='showPlot',
+                        action='store_false',
+                        help='no plot is shown during execution')
+    parser.add_argument('-mo',
+                        '--metricsonly',
+                        dest='metricsOnly',
+                        action='store_true',
+                        help='only compute the metrics: plots are neither shown nor saved '
+                        '(matplotlib is not loaded)')
+    parser.add_argument('-w',
+                        '--workers',
+                        dest='workers',
+                        type=int,
+                        default=1,
+                        metavar='',
+                        help='number of processes used to read the bounding boxes files and to '
+                        'evaluate the classes (or the sets of detections, if several -det '
+                        'folders are informed). Default 1')
+    # Without --overwrite or --resume, the user is asked before replacing the results of -sp
+    outputMode = parser.add_mutually_exclusive_group()
+    outputMode.add_argument('--overwrite',
+                            dest='outputMode',
+                            action='store_const',
+                            const=OutputMode.Overwrite,
+                            default=OutputMode.Ask,
+                            help='replace the results of a previous run saved in -sp without '
+                            'asking. Other files of the folder are kept')
+    outputMode.add_argument('--resume',
+                            dest='outputMode',
+                            action='store_const',
+                            const=OutputMode.Resume,
+                            default=OutputMode.Ask,
+                            help='keep the results of a previous run saved in -sp whose inputs '
+                            'did not change (e.g. the plots of the classes with the same '
+                            'metrics) and write the others, without asking')
+    parser.add_argument('-engine',
+                        dest='engine',
+                        default='scalar',
+                        choices=list(MATCHING_ENGINES),
+                        help='how detections are matched to ground truths: \'scalar\' (one '
+                        'pair at a time), \'vectorized\' (the IOU matrix of each image with '
+                        'NumPy) or \'spatial\' (only the pairs that may reach the IOU threshold, '
+                        'found with a grid of the ground truths of each image). All engines give '
+                        'the same results. Default \'scalar\'')
+    parser.add_argument('-cache',
+                        '--cachefolder',
+                        dest='cacheFolder',
+                        metavar='',
+                        help='folder where the parsed bounding boxes are cached. The next runs '
+                        'with the same folders and options load them from the cache, unless a '
+                        'file was added, removed or modified')
+    parser.add_argument('-p',
+                        '--profile',
+                        dest='profile',
+                        nargs='?',
+                        const='',
+                        metavar='',
+                        help='print the time spent in each stage and counters of the work done. '
+                        'If a file is informed, the report is saved in it as JSON')
+    parser.add_argument('-ml',
+                        '--memorylimit',
+                        dest='memoryLimit',
+                        type=float,
+                        metavar='',
+                        help='evaluate the folders image by image, keeping at most this number '
+                        'of megabytes of results in memory (the rest is written to disk)')
+    parser.add_argument('-minconf',
+                        dest='minConfidence',
+                        type=float,
+                        metavar='',
+                        help='detections with lower confidences are discarded when read')
+    parser.add_argument('-maxdets',
+                        dest='maxDets',
+                        type=int,
+                        metavar='',
+                        help='maximum number of detections per image (the most confident ones) '
+                        'kept when read, as the maxDets of the COCO evaluation')
+    parser.add_argument('-maxdetsper',
+                        dest='maxDetsPer',
+                        default='image',
+                        choices=['image', 'class'],
+                        help='whether -maxdets applies to each image (\'image\') or to each class '
+                        'of each image (\'class\'). Default \'image\'')
+    parser.add_argument('-bootstrap',
+                        dest='bootstrap',
+                        type=int,
+                        metavar='',
+                        help='number of bootstrap resamples of the images used to compute 95%% '
+                        'confidence intervals of the AP of each class and of the mAP')
+    parser.add_argument('-seed',
+                        dest='seed',
+                        type=int,
+                        default=0,
+                        metavar='',
+                        help='seed of the random resamples. Default 0')
+    parser.add_argument('-of',
+                        '--outputformats',
+                        dest='outputFormats',
+                        nargs='+',
+                        default=['txt'],
+                        choices=['txt', 'json', 'csv', 'npz'],
+                        help='files with the results written into -sp: \'txt\' (results.txt), '
+                        '\'json\' (summary with the AP and totals of each class), \'csv\' (one '
+                        'row per class) and \'npz\' (NumPy arrays with the Precision x Recall '
+                        'curves). Default \'txt\'')
+    parser.add_argument('-maxpoints',
+                        dest='maxPoints',
+                        type=int,
+                        metavar='',
+                        help='maximum number of points of each Precision x Recall curve saved in '
+                        'the npz file (the curves are decimated keeping their shape). Default: '
+                        'all points')
+    parser.add_argument('-compare',
+                        dest='compareFolder',
+                        metavar='',
+                        help='folder with the detections of a second detector on the same images. '
+                        'A paired test tells whether the mAP of -det and of this folder differ')
+    parser.add_argument('-test',
+                        dest='test',
+                        default='permutation',
+                        choices=['permutation', 'bootstrap'],
+                        help='paired test used with -compare. Default \'permutation\'')
+    parser.add_argument('-iterations',
+                        dest='iterations',
+                        type=int,
+                        default=1000,
+                        metavar='',
+                        help='number of permutations or resamples of the paired test. Default '
+                        '1000')
+    args = parser.parse_args()
+    # Printed after parsing, so -h and -v do not show it twice
+    print(message)
+
+    iouThreshold = args.iouThreshold
+
+    # Arguments validation
+    errors = []
+    # Validate formats
+    gtFormat = ValidateFormats(args.gtFormat, '-gtformat', errors)
+    detFormat = ValidateFormats(args.detFormat, '-detformat', errors)
+    # Groundtruth folder
+    if ValidateMandatoryArgs(args.gtFolder, '-gt/--gtfolder', errors):
+        gtFolder = ValidatePaths(args.gtFolder, '-gt/--gtfolder', errors, True)
+    else:
+        # errors.pop()
+        gtFolder = os.path.join(currentPath, 'groundtruths')
+        if os.path.isdir(gtFolder) is False:
+            errors.append('folder %s not found' % gtFolder)
+    # Coordinates types
+    gtCoordType = ValidateCoordinatesTypes(args.gtCoordinates, '-gtCoordinates', errors)
+    detCoordType = ValidateCoordinatesTypes(args.detCoordinates, '-detCoordinates', errors)
+    imgSize = (0, 0)
+    if gtCoordType == CoordinatesType.Relative:  # Image size is required
+        imgSize = ValidateImageSize(args.imgSize, '-imgsize', '-gtCoordinates', errors)
+    if detCoordType == CoordinatesType.Relative:  # Image size is required
+        imgSize = ValidateImageSize(args.imgSize, '-imgsize', '-detCoordinates', errors)
+    # Detection folders
+    if ValidateMandatoryArgs(args.detFolder, '-det/--detfolder', errors):
+        detFolders = [
+            ValidatePaths(folder, '-det/--detfolder', errors, True)
+            for folder in ExpandPatterns(args.detFolder)
+        ]
+    else:
+        # errors.pop()
+        detFolders = [os.path.join(currentPath, 'detections')]
+        if os.path.isdir(detFolders[0]) is False:
+            errors.append('folder %s not found' % detFolders[0])
+    detFolder = detFolders[0]
+    if len(detFolders) > 1:
+        if len(set(getSetNames(detFolders))) < len(detFolders):
+            errors.append('argument -det/--detfolder: a folder is informed more than once')
+        for name, informed in [('-ml/--memorylimit', args.memoryLimit),
+                               ('-bootstrap', args.bootstrap), ('-compare', args.compareFolder)]:
+            if informed is not None:
+                errors.append('argument %s: not available with several -det folders' % name)
+    if args.maxDets is not None and args.maxDets < 1:
+        errors.append('argument -maxdets: it must be a positive number')
+    maxDetsPerClass = args.maxDetsPer == 'class'
+    if args.bootstrap is not None and args.bootstrap < 1:
+        errors.append('argument -bootstrap: it must be a positive number')
+    if args.bootstrap is not None and args.memoryLimit is not None:
+        errors.append('argument -bootstrap: not available with -ml/--memorylimit')
+    if args.compareFolder is not None:
+        compareFolder = ValidatePaths(args.compareFolder, '-compare', errors, True)
+        if args.memoryLimit is not None:
+            errors.append('argument -compare: not available with -ml/--memorylimit')
+    engine = MATCHING_ENGINES[args.engine]
+    if engine != MatchingEngine.Scalar and args.memoryLimit is not None:
+        errors.append('argument -engine: not available with -ml/--memorylimit')
+    if args.maxPoints is not None and args.maxPoints < 1:
+        errors.append('argument -maxpoints: it must be a positive number')
+    if args.iterations < 1:
+        errors.append('argument -iterations: it must be a positive number')
+    if args.memoryLimit is not None and (isPackedFile(gtFolder) or isPackedFile(detFolder)):
+        errors.append('argument -ml/--memorylimit: -gt and -det must be folders')
+    if args.savePath is not None:
+        savePath = ValidatePaths(args.savePath, '-sp/--savepath', errors)
+    else:
+        savePath = os.path.join(currentPath, 'results')
+    # Validate savePath
+    # If error, show error messages
+    if len(errors) != 0:
+        print("""usage: Object Detection Metrics [-h] [-v] [-gt] [-det] [-t] [-gtformat]
+                                    [-detformat] [-save]""")
+        print('Object Detection Metrics: error(s): ')
+        [print(e) for e in errors]
         sys.exit()
 
-# Clear folder and save results
-shutil.rmtree(savePath, ignore_errors=True)
-os.makedirs(savePath)
-# Show plot during execution
-showPlot = args.showPlot
-
-# print('iouThreshold= %f' % iouThreshold)
-# print('savePath = %s' % savePath)
-# print('gtFormat = %s' % gtFormat)
-# print('detFormat = %s' % detFormat)
-# print('gtFolder = %s' % gtFolder)
-# print('detFolder = %s' % detFolder)
-# print('gtCoordType = %s' % gtCoordType)
-# print('detCoordType = %s' % detCoordType)
-# print('showPlot %s' % showPlot)
-
-# Get groundtruth boxes
-allBoundingBoxes, allClasses = getBoundingBoxes(gtFolder,
-                                                True,
-                                                gtFormat,
-                                                gtCoordType,
-                                                imgSize=imgSize)
-# Get detected boxes
-allBoundingBoxes, allClasses = getBoundingBoxes(detFolder,
-                                                False,
-                                                detFormat,
-                                                detCoordType,
-                                                allBoundingBoxes,
-                                                allClasses,
-                                                imgSize=imgSize)
-allClasses.sort()
-
-evaluator = Evaluator()
-acc_AP = 0
-validClasses = 0
-
-# Plot Precision x Recall curve
-detections = evaluator.PlotPrecisionRecallCurve(
-    allBoundingBoxes,  # Object containing all bounding boxes (ground truths and detections)
-    IOUThreshold=iouThreshold,  # IOU threshold
-    method=MethodAveragePrecision.EveryPointInterpolation,
-    showAP=True,  # Show Average Precision in the title of the plot
-    showInterpolatedPrecision=False,  # Don't plot the interpolated precision curve
-    savePath=savePath,
-    showGraphic=showPlot)
-
-f = open(os.path.join(savePath, 'results.txt'), 'w')
-f.write('Object Detection Metrics\n')
-f.write('https://github.com/rafaelpadilla/Object-Detection-Metrics\n\n\n')
-f.write('Average Precision (AP), Precision and Recall per class:')
-
-# each detection is a class
-for metricsPerClass in detections:
-
-    # Get metric values per each class
-    cl = metricsPerClass['class']
-    ap = metricsPerClass['AP']
-    precision = metricsPerClass['precision']
-    recall = metricsPerClass['recall']
-    totalPositives = metricsPerClass['total positives']
-    total_TP = metricsPerClass['total TP']
-    total_FP = metricsPerClass['total FP']
-
-    if totalPositives > 0:
-        validClasses = validClasses + 1
-        acc_AP = acc_AP + ap
-        prec = ['%.2f' % p for p in precision]
-        rec = ['%.2f' % r for r in recall]
-        ap_str = "{0:.2f}%".format(ap * 100)
-        # ap_str = "{0:.4f}%".format(ap * 100)
-        print('AP: %s (%s)' % (ap_str, cl))
-        f.write('\n\nClass: %s' % cl)
-        f.write('\nAP: %s' % ap_str)
-        f.write('\nPrecision: %s' % prec)
-        f.write('\nRecall: %s' % rec)
-
-mAP = acc_AP / validClasses
-mAP_str = "{0:.2f}%".format(mAP * 100)
-print('mAP: %s' % mAP_str)
-f.write('\n\n\nmAP: %s' % mAP_str)
+    # Check if path to save results already exists and is not empty
+    outputMode = args.outputMode
+    if outputMode == OutputMode.Ask:
+        outputMode = OutputMode.Overwrite
+        if os.path.isdir(savePath) and os.listdir(savePath):
+            key_pressed = ''
+            while key_pressed.upper() not in ['Y', 'N']:
+                print(f'Folder {savePath} already exists and may contain important results.\n')
+                print('Enter \'Y\' to continue. '
+                      'WARNING: THIS WILL REPLACE THE RESULTS OF A PREVIOUS RUN!')
+                print('Or enter \'N\' to abort and choose another folder to save the results.')
+                print('(Use --overwrite or --resume to run without this question.)')
+                try:
+                    key_pressed = input('')
+                except EOFError:
+                    # No terminal to answer (e.g. a batch job): nothing is replaced
+                    key_pressed = 'N'
+
+            if key_pressed.upper() == 'N':
+                print('Process canceled')
+                sys.exit()
+
+    # Files are written atomically, and only the results of a previous run are replaced
+    output = OutputManager(savePath, outputMode)
+    # Show plot during execution
+    showPlot = args.showPlot
+
+    # print('iouThreshold= %f' % iouThreshold)
+    # print('savePath = %s' % savePath)
+    # print('gtFormat = %s' % gtFormat)
+    # print('detFormat = %s' % detFormat)
+    # print('gtFolder = %s' % gtFolder)
+    # print('detFolder = %s' % detFolder)
+    # print('gtCoordType = %s' % gtCoordType)
+    # print('detCoordType = %s' % detCoordType)
+    # print('showPlot %s' % showPlot)
+
+    # Collect timers and counters only if requested
+    profiler = Profiler() if args.profile is not None else None
+
+    # Parameters of the evaluation saved in the JSON files
+    parameters = {
+        'ground truths': gtFolder,
+        'IOU threshold': iouThreshold,
+        'method': MethodAveragePrecision.EveryPointInterpolation,
+        'detections kept': describePruning(args.minConfidence, args.maxDets, maxDetsPerClass)
+    }
+    if len(detFolders) > 1:
+        evaluateBatch(gtFolder, detFolders, gtFormat, detFormat, gtCoordType, detCoordType,
+                      imgSize, iouThreshold, output, args.metricsOnly, args.workers, profiler,
+                      args.cacheFolder, args.minConfidence, args.maxDets, maxDetsPerClass,
+                      args.outputFormats, args.maxPoints, parameters, engine)
+    elif args.memoryLimit is not None:
+        detections = evaluateStreaming(gtFolder, detFolder, gtFormat, detFormat, gtCoordType,
+                                       detCoordType, imgSize, iouThreshold,
+                                       int(args.memoryLimit * 2**20), profiler,
+                                       args.minConfidence, args.maxDets, maxDetsPerClass)
+        if not args.metricsOnly:
+            saveResultPlots(output,
+                            Evaluator(profiler),
+                            detections,
+                            showGraphic=showPlot,
+                            workers=args.workers)
+    else:
+        # A packed file with both ground truths and detections is read at once, and its records
+        # are evaluated in place (see PackedBoundingBoxes.loadPackedBoundingBoxes)
+        combined = os.path.realpath(gtFolder) == os.path.realpath(detFolder) and \
+            isPackedFile(gtFolder)
+        # Get groundtruth boxes
+        allBoundingBoxes, allClasses = getBoundingBoxes(gtFolder,
+                                                        None if combined else True,
+                                                        gtFormat,
+                                                        gtCoordType,
+                                                        imgSize=imgSize,
+                                                        workers=args.workers,
+                                                        profiler=profiler,
+                                                        cacheFolder=args.cacheFolder,
+                                                        minConfidence=args.minConfidence,
+                                                        maxDets=args.maxDets,
+                                                        maxDetsPerClass=maxDetsPerClass)
+        if args.compareFolder is not None:
+            # The ground truths are read once for both sets of detections
+            if combined:
+                compareBoundingBoxes, _ = loadPackedBoundingBoxes(gtFolder, True)
+            else:
+                compareBoundingBoxes = allBoundingBoxes.clone()
+        # Get detected boxes
+        if not combined:
+            allBoundingBoxes, allClasses = getBoundingBoxes(detFolder,
+                                                            False,
+                                                            detFormat,
+                                                            detCoordType,
+                                                            allBoundingBoxes,
+                                                            allClasses,
+                                                            imgSize=imgSize,
+                                                            workers=args.workers,
+                                                            profiler=profiler,
+                                                            cacheFolder=args.cacheFolder,
+                                                            minConfidence=args.minConfidence,
+                                                            maxDets=args.maxDets,
+                                                            maxDetsPerClass=maxDetsPerClass)
+        allClasses.sort()
+
+        evaluator = Evaluator(profiler)
+        # Both -bootstrap and -compare use the matches of each image
+        matches = None
+        if args.bootstrap is not None or args.compareFolder is not None:
+            matches = evaluator.GetImageMatches(allBoundingBoxes, iouThreshold, engine)
+        detections = evaluator.GetPascalVOCMetrics(
+            allBoundingBoxes,  # All bounding boxes (ground truths and detections)
+            IOUThreshold=iouThreshold,  # IOU threshold
+            method=MethodAveragePrecision.EveryPointInterpolation,
+            engine=engine,
+            workers=args.workers)
+        if not args.metricsOnly:
+            # Plot Precision x Recall curve (only the classes whose metrics changed, if resumed)
+            saveResultPlots(output,
+                            evaluator,
+                            detections,
+                            showGraphic=showPlot,
+                            workers=args.workers)
+        if args.bootstrap is not None:
+            intervals = evaluator.GetBootstrapMetrics(
+                allBoundingBoxes,
+                IOUThreshold=iouThreshold,
+                method=MethodAveragePrecision.EveryPointInterpolation,
+                engine=engine,
+                resamples=args.bootstrap,
+                seed=args.seed,
+                matches=matches)
+            intervals['classes'] = {r['class']: r for r in intervals['classes']}
+        if args.compareFolder is not None:
+            compareBoundingBoxes, _ = getBoundingBoxes(compareFolder,
+                                                       False,
+                                                       detFormat,
+                                                       detCoordType,
+                                                       compareBoundingBoxes,
+                                                       imgSize=imgSize,
+                                                       workers=args.workers,
+                                                       profiler=profiler,
+                                                       cacheFolder=args.cacheFolder,
+                                                       minConfidence=args.minConfidence,
+                                                       maxDets=args.maxDets,
+                                                       maxDetsPerClass=maxDetsPerClass)
+            comparison = evaluator.GetPairedTest(
+                allBoundingBoxes,
+                compareBoundingBoxes,
+                IOUThreshold=iouThreshold,
+                method=MethodAveragePrecision.EveryPointInterpolation,
+                engine=engine,
+                test=SignificanceTest[args.test.capitalize()],
+                iterations=args.iterations,
+                seed=args.seed,
+                matchesA=matches)
+
+    if len(detFolders) == 1:
+        if args.bootstrap is None:
+            intervals = None
+        extra = dict(parameters, detections=detFolder)
+        comparison_str = None
+        if args.compareFolder is not None:
+            comparison_str = formatComparison(comparison, args.compareFolder)
+            extra['paired test'] = {
+                k: comparison[k]
+                for k in [
+                    'test', 'iterations', 'mAP A', 'mAP B', 'difference', 'difference lower',
+                    'difference upper', 'p-value'
+                ]
+            }
+            extra['paired test']['compared with'] = compareFolder
+        txtName = RESULT_FILES['txt'] if 'txt' in args.outputFormats else None
+        writeResults(output, txtName, detections, parameters['detections kept'], intervals,
+                     comparison_str)
+        writeResultFiles(output, detections, args.outputFormats, args.maxPoints, intervals,
+                         extra)
+
+    # Results of a previous run that were not written again are removed
+    output.close()
+    if outputMode == OutputMode.Resume:
+        print('Results saved in %s: %d files written, %d kept' %
+              (savePath, output.written, output.kept))
+
+    if profiler is not None:
+        if args.profile == '':
+            print(profiler.formatReport())
+        else:
+            with open(args.profile, 'w') as fp:
+                json.dump(profiler.getReport(), fp, indent=2)
+
+
+if __name__ == '__main__':
+    main()